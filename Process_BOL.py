@@ -1,8 +1,13 @@
+import os
+import json
 import time
 from utils import UIUtils
 from pdf_processor import PDFProcessor
 from data_processor import DataProcessor
-from csv_exporter import CSVExporter
+from output_sink import CSVSink
+from result_cache import result_cache
+from metrics import PipelineMetrics
+from config import OUTPUT_CSV_NAME
 
 def print_robot():
     robot = """
@@ -34,31 +39,31 @@ def main():
     UIUtils.print_with_typing_effect("Welcome to the BOL Processing System!")
     print_hammer()
     
-    # Step 1: Process PDF
+    # Step 1: Extract and parse the PDF; pages go straight from the PDF
+    # processor to the data processor, and invoices straight into the CSV,
+    # without intermediate files. Text of PDFs and pages seen before is reused.
     UIUtils.print_with_typing_effect("\nStep 1: Processing PDF...")
-    UIUtils.loading_animation(1, "Initializing PDF processor")
-    pdf_processor = PDFProcessor()
-    if not pdf_processor.process_first_pdf():
-        print("Failed to process PDF. Exiting...")
-        return
-    
-    # Step 2: Process Text Files
-    UIUtils.print_with_typing_effect("\nStep 2: Processing text files...")
-    UIUtils.loading_animation(1, "Initializing data processor")
-    data_processor = DataProcessor()
-    if not data_processor.process_all_files():
-        print("Failed to process text files. Exiting...")
-        return
-    
-    # Step 3: Create CSV
-    UIUtils.print_with_typing_effect("\nStep 3: Creating CSV file...")
-    UIUtils.loading_animation(1, "Initializing CSV exporter")
-    csv_exporter = CSVExporter()
-    if not csv_exporter.combine_to_csv():
-        print("Failed to create CSV file. Exiting...")
-        return
+    UIUtils.loading_animation(1, "Initializing PDF and data processors")
+    metrics = PipelineMetrics("bol")
+    data_processor = DataProcessor(metrics=metrics)
+    pdf_processor = PDFProcessor(".", cache=result_cache, metrics=metrics)  # Read the PDF from the current directory
+    output_path = os.path.join(data_processor.session_dir, OUTPUT_CSV_NAME)
+    with CSVSink(output_path) as sink:
+        if not data_processor.process_pages(pdf_processor.iter_first_pdf_pages(), sink):
+            print("Failed to process PDF. Exiting...")
+            sink.abort()
+            return
+
+        # Step 2: Finish the CSV the invoices were written to
+        UIUtils.print_with_typing_effect("\nStep 2: Creating CSV file...")
+        if not sink.rows_written:
+            print("Failed to create CSV file. Exiting...")
+            sink.abort()
+            return
+    print(f"Wrote {sink.rows_written} rows to {OUTPUT_CSV_NAME}")
     
     UIUtils.print_with_typing_effect("\nAll done! Your BOL has been processed successfully!")
+    print(json.dumps(metrics.to_dict(), indent=2))
     print_robot()
 
 if __name__ == "__main__":
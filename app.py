@@ -1,18 +1,31 @@
 import os
 import csv
 import math
+import itertools
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import platform
+import numpy as np
 import pandas as pd
-import re
 import shutil
-from difflib import get_close_matches
 from io import StringIO
-from flask import Flask, render_template, request, send_file, jsonify, session
+from flask import Flask, Response, render_template, request, send_file, jsonify, session, stream_with_context
 from werkzeug.utils import secure_filename
 from data_processor import DataProcessor
 from csv_exporter import CSVExporter
-from config import OUTPUT_CSV_NAME  # e.g. "combined_data.csv"
+from column_matcher import header_resolver
+from master_data import MASTER_DATA_DIR, MASTER_UOM_FILE, MasterUOM, master_uom_store, master_uom_cache, normalize_item, file_version
+from uom_calculator import calculate_uom_columns
+from ship_to import ship_to_classifier
+from metrics import PipelineMetrics, MetricsStore, timed_stage, timed_iter
+from result_cache import result_cache, cache_key
+from table_reader import read_table, read_table_header, iter_table_chunks
+from jobs import JobManager
+from session_store import SessionIndex, SessionJanitor, ResultRegistry
+from result_stream import SUPPORTED_ENCODINGS, iter_file, iter_compressed, xlsx_path_for
+from config import OUTPUT_CSV_NAME, OUTPUT_ZIP_NAME, CSV_CHUNK_SIZE, JOB_WORKERS, BATCH_WORKERS, BATCH_MAX_FILES, BATCH_MAX_FILE_BYTES, BATCH_MAX_TOTAL_BYTES, SESSION_TTL_SECONDS, JANITOR_INTERVAL_SECONDS  # e.g. "combined_data.csv"
 #test commit2
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = os.path.dirname(os.path.abspath(__file__))
@@ -25,66 +38,38 @@ app.secret_key = 'your-secret-key-here'  # Required for session management
 # Allowed extensions for CSV/XLSX upload
 ALLOWED_CSV_EXTENSIONS = {'csv', 'xlsx', 'xls'}
 
-# Path for the master UOM file
-MASTER_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "master_data")
-MASTER_UOM_FILE = os.path.join(MASTER_DATA_DIR, "master_uom.csv")
+# Step 1 UOM uploads are saved under this name (plus extension) in the session directory
+UPLOADED_UOM_NAME = "uploaded_uom"
 
-# Ensure master data directory exists
-if not os.path.exists(MASTER_DATA_DIR):
-    os.makedirs(MASTER_DATA_DIR)
+NO_UOM_FILE_MESSAGE = "No UOM file found. Please upload a UOM file first or contact an administrator to set up the master UOM file."
+
+# Processing sessions and finished results, indexed in a shared SQLite file
+SESSIONS_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "processing_sessions")
+SESSIONS_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "processing_sessions.db")
+os.makedirs(SESSIONS_ROOT, exist_ok=True)
+session_index = SessionIndex(SESSIONS_DB)
+session_index.import_directories(SESSIONS_ROOT)
+result_registry = ResultRegistry(SESSIONS_DB)
+metrics_store = MetricsStore(SESSIONS_DB)
+
+# Background jobs for upload processing; finished outputs get a download token
+# and their stage metrics are added to the totals served by /metrics
+job_manager = JobManager(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "processing_jobs"),
+    max_workers=JOB_WORKERS,
+    result_registry=result_registry,
+    metrics_store=metrics_store
+)
+
+# Expire sessions, job records and download tokens in the background
+session_janitor = SessionJanitor(session_index, SESSION_TTL_SECONDS, JANITOR_INTERVAL_SECONDS,
+                                 job_manager, result_registry)
+session_janitor.start()
 
 def allowed_file(filename, allowed_set):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_set
 
-# Helper function to normalize column headers for matching
-def normalize_header(header):
-    if not isinstance(header, str):
-        return ""
-    # Convert to lowercase
-    header = str(header).lower()
-    # Remove special characters and extra spaces
-    header = re.sub(r'[^a-z0-9]', '', header)
-    return header
-
-# Helper function to find the best matching column in a dataframe
-def find_matching_column(df, target_column, required=True):
-    """
-    Find the best matching column in the dataframe for a target column name.
-    
-    Args:
-        df: DataFrame to search in
-        target_column: The target column name to find
-        required: If True, raises ValueError if no match found
-        
-    Returns:
-        The actual column name in the dataframe that best matches the target
-    """
-    # If the column exists exactly as specified, use it
-    if target_column in df.columns:
-        return target_column
-    
-    # Normalize all column headers for matching
-    normalized_target = normalize_header(target_column)
-    normalized_headers = {normalize_header(col): col for col in df.columns}
-    
-    # Look for exact match with normalized headers
-    if normalized_target in normalized_headers:
-        return normalized_headers[normalized_target]
-    
-    # Try to find the closest match
-    matches = get_close_matches(normalized_target, normalized_headers.keys(), n=1, cutoff=0.6)
-    
-    if matches:
-        matched_header = normalized_headers[matches[0]]
-        print(f"Matched '{target_column}' to '{matched_header}' in the uploaded file")
-        return matched_header
-    
-    if required:
-        raise ValueError(f"Could not find a suitable match for required column: {target_column}")
-    
-    return None
-
-def process_first_csv(file_path, session_dir):
+def process_first_csv(file_path, session_dir, progress=None, metrics=None, output_path=None):
     """Process the first CSV file ('Sensual UOM Excel').
     Extract the following columns:
     - Item #
@@ -111,89 +96,104 @@ def process_first_csv(file_path, session_dir):
     - Column AG (32) = "PALLET"
     - Column AH (33) = "FINAL CUBE"
     - Column AI (34) = "TOTAL WEIGHT"
+    
+    output_path defaults to the session's output CSV; jobs pass a path of
+    their own.
     """
+    output_path = output_path or os.path.join(session_dir, OUTPUT_CSV_NAME)
     try:
-        # Read the CSV or Excel file
+        # Read the header of the CSV or Excel file; the data is read once the columns are known
         ext = os.path.splitext(file_path)[1].lower()
-        if ext == ".csv":
-            input_df = pd.read_csv(file_path, dtype=str)
-        elif ext in [".xlsx", ".xls"]:
-            input_df = pd.read_excel(file_path, dtype=str)
-        else:
+        if ext not in [".csv", ".xlsx", ".xls"]:
             return False, "Unsupported file extension"
+        with timed_stage(metrics, "file_read"):
+            header_df = read_table_header(file_path)
         
         # Find column mappings - make best guess at matching columns based on names
         required_columns = ["Item #", "Weight", "Cube", "Length", "Width", "Height", "Sequence 10: QTY"]
         column_mappings = {}
         missing_columns = []
         
-        print(f"Input columns: {input_df.columns.tolist()}")
+        print(f"Input columns: {header_df.columns.tolist()}")
         
-        # Find the best matches for each required column
-        for col in required_columns:
-            try:
-                matched_col = find_matching_column(input_df, col)
-                column_mappings[col] = matched_col
-                print(f"Matched '{col}' to '{matched_col}'")
-            except ValueError as e:
-                missing_columns.append(col)
-                print(f"Could not match column: {col}")
+        with timed_stage(metrics, "header_match"):
+            # Find the best matches for each required column (cached per header layout)
+            resolved = header_resolver.resolve(header_df.columns, required_columns)
+            for col in required_columns:
+                matched_col = resolved[col]
+                if matched_col is not None:
+                    column_mappings[col] = matched_col
+                    print(f"Matched '{col}' to '{matched_col}'")
+                else:
+                    missing_columns.append(col)
+                    print(f"Could not match column: {col}")
         
         if missing_columns:
             return False, f"Missing columns in input file: {', '.join(missing_columns)}"
         
-        # Create a new DataFrame with the required structure
-        # Add +1 row for the header row in the output
-        num_rows = len(input_df) + 1
-        column_count = 35  # AI is the 34th column (0-indexed)
-        output_df = pd.DataFrame("", index=range(num_rows), columns=range(column_count))
-        
-        # Map column names to indices (0-based) - shifted one to the left for all columns starting from U
-        column_mapping = {
-            18: "Size",                               # Column S
-            20: "UOM",                                # Column U
-            21: "Cartons",                            # Column V
-            22: "CARTONS",                            # Column W
-            23: "weight w/out add",                   # Column X
-            24: "individual carton weight (add 2 lbs)", # Column Y
-            25: "cube in cm",                         # Column Z
-            26: "Length",                             # Column AA
-            27: "Width",                              # Column AB
-            28: "Height",                             # Column AC
-            29: "dimension",                          # Column AD
-            30: "cube in cft",                        # Column AE
-            31: "total cubes",                        # Column AF
-            32: "PALLET",                             # Column AG
-            33: "FINAL CUBE",                         # Column AH
-            34: "TOTAL WEIGHT"                        # Column AI
-        }
-        
-        # Add column headers to the first row of the output
-        for col_idx, col_name in column_mapping.items():
-            output_df.iloc[0, col_idx] = col_name
-        
-        # Basic data mapping from input to output (without calculations)
-        for i in range(len(input_df)):
-            # Map input row i to output row i+1 (to account for header row)
-            output_row = i + 1
-            item_id = input_df.iloc[i][column_mappings["Item #"]]
+        # Only the matched columns are read
+        with timed_stage(metrics, "file_read") as stage:
+            input_df = read_table(file_path, columns=list(dict.fromkeys(column_mappings.values())))
+            stage.add(rows=len(input_df), bytes_read=os.path.getsize(file_path))
+        
+        with timed_stage(metrics, "calc") as stage:
+            # Create a new DataFrame with the required structure
+            # Add +1 row for the header row in the output
+            num_rows = len(input_df) + 1
+            column_count = 35  # AI is the 34th column (0-indexed)
+            output_df = pd.DataFrame("", index=range(num_rows), columns=range(column_count))
+        
+            # Map column names to indices (0-based) - shifted one to the left for all columns starting from U
+            column_mapping = {
+                18: "Size",                               # Column S
+                20: "UOM",                                # Column U
+                21: "Cartons",                            # Column V
+                22: "CARTONS",                            # Column W
+                23: "weight w/out add",                   # Column X
+                24: "individual carton weight (add 2 lbs)", # Column Y
+                25: "cube in cm",                         # Column Z
+                26: "Length",                             # Column AA
+                27: "Width",                              # Column AB
+                28: "Height",                             # Column AC
+                29: "dimension",                          # Column AD
+                30: "cube in cft",                        # Column AE
+                31: "total cubes",                        # Column AF
+                32: "PALLET",                             # Column AG
+                33: "FINAL CUBE",                         # Column AH
+                34: "TOTAL WEIGHT"                        # Column AI
+            }
+        
+            # Add column headers to the first row of the output
+            for col_idx, col_name in column_mapping.items():
+                output_df.iloc[0, col_idx] = col_name
+        
+            # Basic data mapping from input to output (without calculations)
+            for i in range(len(input_df)):
+                # Map input row i to output row i+1 (to account for header row)
+                output_row = i + 1
+                item_id = input_df.iloc[i][column_mappings["Item #"]]
             
-            # Set the UOM value to "" for all rows - shifted to correct column
-            if "Sequence 10: QTY" in column_mappings:
-                output_df.iloc[output_row, 20] = input_df.iloc[i][column_mappings["Sequence 10: QTY"]]  # Use the QTY column
-            else:
-                output_df.iloc[output_row, 20] = ""  # Default to empty string if column not found
+                # Set the UOM value to "" for all rows - shifted to correct column
+                if "Sequence 10: QTY" in column_mappings:
+                    output_df.iloc[output_row, 20] = input_df.iloc[i][column_mappings["Sequence 10: QTY"]]  # Use the QTY column
+                else:
+                    output_df.iloc[output_row, 20] = ""  # Default to empty string if column not found
             
-            # Copy basic values from input to output - shifted to correct columns
-            output_df.iloc[output_row, 23] = input_df.iloc[i][column_mappings["Weight"]]     # weight w/out add
-            output_df.iloc[output_row, 25] = input_df.iloc[i][column_mappings["Cube"]]       # cube in cm
-            output_df.iloc[output_row, 26] = input_df.iloc[i][column_mappings["Length"]]     # Length
-            output_df.iloc[output_row, 27] = input_df.iloc[i][column_mappings["Width"]]      # Width
-            output_df.iloc[output_row, 28] = input_df.iloc[i][column_mappings["Height"]]     # Height
-        
-        # Save the DataFrame to the session directory with the output name
-        output_path = os.path.join(session_dir, OUTPUT_CSV_NAME)
-        output_df.to_csv(output_path, index=False, header=False)
+                # Copy basic values from input to output - shifted to correct columns
+                output_df.iloc[output_row, 23] = input_df.iloc[i][column_mappings["Weight"]]     # weight w/out add
+                output_df.iloc[output_row, 25] = input_df.iloc[i][column_mappings["Cube"]]       # cube in cm
+                output_df.iloc[output_row, 26] = input_df.iloc[i][column_mappings["Length"]]     # Length
+                output_df.iloc[output_row, 27] = input_df.iloc[i][column_mappings["Width"]]      # Width
+                output_df.iloc[output_row, 28] = input_df.iloc[i][column_mappings["Height"]]     # Height
+            stage.add(rows=len(input_df))
+        
+        # Save the DataFrame under the output name
+        with timed_stage(metrics, "write") as stage:
+            output_df.to_csv(output_path, index=False, header=False)
+            stage.add(rows=num_rows, bytes_written=os.path.getsize(output_path))
+        
+        if progress:
+            progress(rows_processed=len(input_df))
         
         return True, "First CSV processed successfully"
         
@@ -202,7 +202,149 @@ def process_first_csv(file_path, session_dir):
         traceback.print_exc()
         return False, str(e)
 
-def process_second_csv(file_path, session_dir):
+# Column headers of the 940 output, by column index
+OUTPUT_940_HEADERS = {
+    10: "Order Date",                          # Column K
+    11: "Customer",                            # Column L
+    12: "Ship to Name",                        # Column M
+    13: "Start Date",                          # Column N
+    14: "Cancel Date",                         # Column O
+    15: "PO#",                                 # Column P
+    16: "Item/Style",                          # Column Q
+    17: "INVOICE #",                           # Column R
+    19: "TOTAL PIECES",                        # Column T
+    18: "Size",                                # Column S
+    20: "UOM",                                 # Column U
+    21: "Cartons",                             # Column V
+    22: "CARTONS",                             # Column W
+    23: "weight w/out add",                    # Column X
+    24: "individual carton weight (add 2 lbs)",# Column Y
+    25: "cube in cm",                          # Column Z
+    26: "Length",                              # Column AA
+    27: "Width",                               # Column AB
+    28: "Height",                              # Column AC
+    29: "dimension",                           # Column AD
+    30: "cube in cft",                         # Column AE
+    31: "total cubes",                         # Column AF
+    32: "PALLET",                              # Column AG
+    33: "FINAL CUBE",                          # Column AH
+    34: "TOTAL WEIGHT"                         # Column AI
+}
+OUTPUT_940_COLUMN_COUNT = 35  # AI is the 34th column (0-indexed)
+
+def build_940_rows(input_df, column_mappings, master, row_offset=0, metrics=None):
+    """Enrich a chunk of 940 lines with master UOM data.
+
+    Args:
+        input_df: Chunk of the incoming 940 with all columns as strings
+        column_mappings: Required column name -> column in the 940
+        master: MasterUOM to match items against
+        row_offset: Position of the chunk's first line in the whole file
+        metrics: Optional PipelineMetrics; item numbers are normalized in
+            the "normalize" stage and the output columns filled in as
+            "assemble" (calculate_uom_columns times item_match and calc)
+
+    Returns:
+        Tuple of (rows, match_types) where rows are the 35-column output
+        rows for the chunk.
+    """
+    num_rows = len(input_df)
+    with timed_stage(metrics, "normalize") as stage:
+        stage.add(rows=num_rows)
+        normalized_items = input_df[column_mappings['Item']].map(normalize_item)
+    
+    # Join the master data and compute the derived columns for all rows at once
+    uom_columns, match_types = calculate_uom_columns(
+        normalized_items, input_df[column_mappings["Qty"]], master, metrics
+    )
+    
+    # Only print the first 10 unmatched items of the file to avoid flooding logs
+    for i in range(min(10 - row_offset, num_rows)):
+        if match_types[i] == "none":
+            item_value = input_df.iloc[i][column_mappings["Item"]]
+            item_key_raw = str(item_value).strip() if pd.notna(item_value) else ""
+            print(f"Unmatched item: '{item_key_raw}' (normalized: '{normalized_items.iloc[i]}')")
+    
+    def input_column(name):
+        values = input_df[column_mappings[name]]
+        return values.where(values.notna(), "").to_numpy(dtype=object)
+    
+    # Fill in data for each mapped column from step 2
+    with timed_stage(metrics, "assemble") as stage:
+        stage.add(rows=num_rows)
+        data_columns = {
+            11: np.full(num_rows, "SENSUAL", dtype=object),  # Customer is always "SENSUAL"
+            12: ship_to_classifier.classify(input_df[column_mappings["Ship To Address 1"]]),
+            13: input_column("Ship Date"),
+            14: input_column("CANCEL DATE"),
+            15: input_column("P. O. #"),
+            16: input_column("Item"),   # Item/Style
+            17: input_column("Num"),    # INVOICE #
+            19: input_column("Qty"),    # TOTAL PIECES
+        }
+        data_columns.update(uom_columns)
+    
+    empty_column = np.full(num_rows, "", dtype=object)
+    rows = zip(*(data_columns.get(col_idx, empty_column) for col_idx in range(OUTPUT_940_COLUMN_COUNT)))
+    return rows, match_types
+
+def resolve_master(session_dir):
+    """Return the MasterUOM to merge against, or None if there isn't one.
+
+    The published master UOM file is used when it exists, otherwise the UOM
+    file uploaded in step 1 of the session.
+    """
+    # Check if we have a master UOM file to use
+    if os.path.exists(MASTER_UOM_FILE):
+        print(f"Using master UOM file: {MASTER_UOM_FILE}")
+        master = master_uom_cache.get()
+        print(f"Master UOM version: {master.version}")
+        return master
+    
+    # If no master file exists, use the one uploaded in step 1
+    uploaded_path = uploaded_uom_path(session_dir)
+    if uploaded_path is None:
+        return None
+    
+    print(f"Using uploaded UOM file: {uploaded_path}")
+    return MasterUOM.load(uploaded_path)
+
+def uploaded_uom_path(session_dir):
+    """Return the UOM file uploaded in step 1 of the session, or None.
+    
+    The upload is saved under UPLOADED_UOM_NAME, so 940 uploads and
+    generated outputs in the same directory are never mistaken for it.
+    """
+    for ext in sorted(ALLOWED_CSV_EXTENSIONS):
+        path = os.path.join(session_dir, f"{UPLOADED_UOM_NAME}.{ext}")
+        if os.path.exists(path):
+            return path
+    return None
+
+# Bump when a code change alters the 940 output, so results cached before it miss
+RESULT_FORMAT_940 = 2
+
+def result_key_940(file_path, column_mappings, master):
+    """Return the result cache key of merging a 940 file with a master UOM.
+
+    The key covers everything the output depends on: the output format, the
+    file's bytes and type, the columns its headers resolved to, the master
+    UOM version and the ship-to rules, so a code change, a newly confirmed
+    header alias, publishing a new master UOM or editing the rules makes
+    earlier results miss.
+    """
+    return cache_key(
+        "940",
+        RESULT_FORMAT_940,
+        os.path.splitext(file_path)[1].lower(),
+        file_version(file_path, length=None),
+        sorted(column_mappings.items()),
+        master.version or file_version(master.source_path),
+        file_version(ship_to_classifier.rules_path),
+    )
+
+def process_second_csv(file_path, session_dir, chunk_size=CSV_CHUNK_SIZE, progress=None,
+                       output_path=None, master=None, metrics=None, cache=result_cache):
     """Process the second CSV file ('incoming 940').
     Extract the following columns:
     - Num
@@ -226,359 +368,214 @@ def process_second_csv(file_path, session_dir):
     
     Only rows from the second CSV are included in the final output.
     Item data from the first CSV is matched using Item # = Item/Style.
+    
+    The file is read chunk_size rows at a time and each enriched chunk is
+    written straight to the output CSV, so memory stays bounded by the
+    chunk size rather than the file size. If given, progress is called
+    with the running row and match counts after each chunk, and metrics
+    (a PipelineMetrics) collects the time and counts of each stage.
+    
+    output_path defaults to the session's output CSV; batches pass their own
+    path and an already loaded master to share it across files.
+    
+    Finished outputs are kept in cache (a DiskLRUCache, None to disable), so
+    uploading the same file again with the same master UOM copies the
+    earlier output instead of merging it again.
     """
+    output_path = output_path or os.path.join(session_dir, OUTPUT_CSV_NAME)
+    temp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
     try:
-        # Read second input file as DataFrame with all columns as strings
+        # Read the second input file in chunks with all columns as strings
         ext = os.path.splitext(file_path)[1].lower()
-        if ext == ".csv":
-            input_df = pd.read_csv(file_path, dtype=str)
-        elif ext in [".xlsx", ".xls"]:
-            input_df = pd.read_excel(file_path, dtype=str)
-        else:
+        if ext not in [".csv", ".xlsx", ".xls"]:
             return False, "Unsupported file extension"
         
+        if master is None:
+            with timed_stage(metrics, "master_load"):
+                master = resolve_master(session_dir)
+        
+        with timed_stage(metrics, "file_read") as stage:
+            header_df = read_table_header(file_path)
+            stage.add(bytes_read=os.path.getsize(file_path))
+        
         # Try to find matching columns for required fields
         required_columns = ["Num", "Ship Date", "P. O. #", "CANCEL DATE", 
                            "Item", "Qty", "Ship To Address 1"]
         column_mappings = {}
         missing_columns = []
         
-        print(f"Second CSV columns: {input_df.columns.tolist()}")
+        print(f"Second CSV columns: {header_df.columns.tolist()}")
         
-        # Find the best matches for each required column
-        for col in required_columns:
-            try:
-                matched_col = find_matching_column(input_df, col)
-                column_mappings[col] = matched_col
-                print(f"Matched '{col}' to '{matched_col}'")
-            except ValueError as e:
-                missing_columns.append(col)
-                print(f"Could not match column: {col}")
+        with timed_stage(metrics, "header_match"):
+            # Find the best matches for each required column (cached per header layout)
+            resolved = header_resolver.resolve(header_df.columns, required_columns)
+            for col in required_columns:
+                matched_col = resolved[col]
+                if matched_col is not None:
+                    column_mappings[col] = matched_col
+                    print(f"Matched '{col}' to '{matched_col}'")
+                else:
+                    missing_columns.append(col)
+                    print(f"Could not match column: {col}")
         
         if missing_columns:
             return False, f"Missing columns in second CSV: {', '.join(missing_columns)}"
         
-        # Check if we have a master UOM file to use
-        if os.path.exists(MASTER_UOM_FILE):
-            first_csv_original_path = MASTER_UOM_FILE
-            print(f"Using master UOM file: {MASTER_UOM_FILE}")
-        else:
-            # If no master file exists, look for an uploaded one
-            first_csv_files = [f for f in os.listdir(session_dir) if f.endswith(('.csv', '.xlsx', '.xls')) 
-                              and f != OUTPUT_CSV_NAME]
-            
-            if not first_csv_files:
-                return False, "No UOM file found. Please upload a UOM file first or contact an administrator to set up the master UOM file."
-            
-            # Use the first file found as the first CSV
-            first_csv_original_path = os.path.join(session_dir, first_csv_files[0])
-            print(f"Using uploaded UOM file: {first_csv_original_path}")
-        
-        # Read the UOM file (either master or uploaded)
-        ext = os.path.splitext(first_csv_original_path)[1].lower()
-        if ext == ".csv":
-            first_df_original = pd.read_csv(first_csv_original_path, dtype=str)
-        elif ext in [".xlsx", ".xls"]:
-            first_df_original = pd.read_excel(first_csv_original_path, dtype=str)
-        else:
-            return False, "Unsupported UOM file extension"
-        
-        # Try to find matching columns for required fields in first CSV
-        required_columns_first = ["Item #", "Weight", "Cube", "Length", "Width", "Height", "Sequence 10: QTY"]
-        first_csv_column_mappings = {}
-        missing_columns_first = []
-        
-        # Find the best matches for each required column in first CSV
-        for col in required_columns_first:
-            try:
-                matched_col = find_matching_column(first_df_original, col)
-                first_csv_column_mappings[col] = matched_col
-                print(f"First CSV matched '{col}' to '{matched_col}'")
-            except ValueError as e:
-                missing_columns_first.append(col)
-                print(f"Could not match column in first CSV: {col}")
-        
-        if missing_columns_first:
-            return False, f"Missing columns in UOM file: {', '.join(missing_columns_first)}"
-        
-        # Debug: Print first few rows of both dataframes to compare formats
+        # An identical earlier upload against the same master already has an output
+        result_key = None
+        if cache is not None and master is not None:
+            with timed_stage(metrics, "cache_lookup") as stage:
+                result_key = result_key_940(file_path, column_mappings, master)
+                stage.add(bytes_read=os.path.getsize(file_path))
+                cached = cache.get_file(result_key, output_path)
+            if cached is not None:
+                print(f"Using cached result for {os.path.basename(file_path)}")
+                if progress:
+                    progress(**cached['counts'])
+                return True, cached['message']
+        
+        # Stream only the matched columns from here on
+        chunks = timed_iter(metrics, "file_read",
+                            iter_table_chunks(file_path, chunk_size, columns=list(dict.fromkeys(column_mappings.values()))))
+        first_chunk = next(chunks)
+        
+        if master is None:
+            return False, NO_UOM_FILE_MESSAGE
+        
+        # Debug: Print first few rows of both files to compare formats
         print("First CSV 'Item #' column (first 5 rows):")
-        for i in range(min(5, len(first_df_original))):
-            print(f"  Row {i}: '{first_df_original.iloc[i][first_csv_column_mappings['Item #']]}'")
-        
-        print("\nSecond CSV 'Item' column (first 5 rows):")
-        for i in range(min(5, len(input_df))):
-            print(f"  Row {i}: '{input_df.iloc[i][column_mappings['Item']]}'")
-        
-        # Function to normalize item values for matching
-        def normalize_item(item_value):
-            if not pd.isna(item_value):
-                # Convert to string and strip whitespace
-                item_str = str(item_value).strip()
-                # Remove any special characters or formatting that might differ
-                # Convert to uppercase for case-insensitive matching
-                item_str = item_str.upper()
-                # Replace common separators with empty string
-                for char in ['-', '.', ' ', '_']:
-                    item_str = item_str.replace(char, '')
-                return item_str
-            return ""
-        
-        # Create normalized versions of the item columns for both DataFrames
-        first_df_original['normalized_item'] = first_df_original[first_csv_column_mappings['Item #']].apply(normalize_item)
-        input_df['normalized_item'] = input_df[column_mappings['Item']].apply(normalize_item)
-        
-        # Create sets of normalized items from both DataFrames to check for common items
-        first_items = set(first_df_original['normalized_item'].unique())
-        second_items = set(input_df['normalized_item'].unique())
-        common_items = first_items.intersection(second_items)
-        
-        print(f"\nNumber of unique normalized items in first CSV: {len(first_items)}")
-        print(f"Number of unique normalized items in second CSV: {len(second_items)}")
-        print(f"Number of common normalized items: {len(common_items)}")
-        
-        if len(common_items) > 0:
-            print(f"Sample common items (up to 5): {list(common_items)[:5]}")
-        
-        # Create a dictionary to map item data from the first CSV using normalized Item # as key
-        item_data = {}
-        item_data_raw_keys = {}  # For debugging
-        
-        for _, row in first_df_original.iterrows():
-            item_id = str(row[first_csv_column_mappings["Item #"]]).strip() if pd.notna(row[first_csv_column_mappings["Item #"]]) else ""
-            normalized_id = normalize_item(item_id)
-            
-            if normalized_id:
-                item_data[normalized_id] = {
-                    "weight": row[first_csv_column_mappings["Weight"]],     # Using original Weight column 
-                    "cube": row[first_csv_column_mappings["Cube"]],         # Using original Cube column
-                    "length": row[first_csv_column_mappings["Length"]],     # Using original Length column
-                    "width": row[first_csv_column_mappings["Width"]],       # Using original Width column
-                    "height": row[first_csv_column_mappings["Height"]],     # Using original Height column
-                    "qty": row[first_csv_column_mappings["Sequence 10: QTY"]] if "Sequence 10: QTY" in first_csv_column_mappings else "10"  # Use QTY from master or default to 10
-                }
-                item_data_raw_keys[item_id] = normalized_id  # Store mapping for debugging
-        
-        print(f"\nCreated item_data dictionary with {len(item_data)} entries")
-        print(f"Sample normalized item keys: {list(item_data.keys())[:5]}")
-        print(f"Sample raw to normalized key mappings: {dict(list(item_data_raw_keys.items())[:5])}")
-        
-        # Create a new DataFrame for the output with all required columns
-        num_rows = len(input_df) + 1  # +1 for header row
-        column_count = 35  # AI is the 34th column (0-indexed)
-        output_df = pd.DataFrame("", index=range(num_rows), columns=range(column_count))
-        
-        # Define column mappings for all headers
-        all_column_mapping = {
-            10: "Order Date",                          # Column K
-            11: "Customer",                            # Column L
-            12: "Ship to Name",                        # Column M
-            13: "Start Date",                          # Column N
-            14: "Cancel Date",                         # Column O
-            15: "PO#",                                 # Column P
-            16: "Item/Style",                          # Column Q
-            17: "INVOICE #",                           # Column R
-            19: "TOTAL PIECES",                        # Column T
-            18: "Size",                                # Column S
-            20: "UOM",                                 # Column U
-            21: "Cartons",                             # Column V
-            22: "CARTONS",                             # Column W
-            23: "weight w/out add",                    # Column X
-            24: "individual carton weight (add 2 lbs)",# Column Y
-            25: "cube in cm",                          # Column Z
-            26: "Length",                              # Column AA
-            27: "Width",                               # Column AB
-            28: "Height",                              # Column AC
-            29: "dimension",                           # Column AD
-            30: "cube in cft",                         # Column AE
-            31: "total cubes",                         # Column AF
-            32: "PALLET",                              # Column AG
-            33: "FINAL CUBE",                          # Column AH
-            34: "TOTAL WEIGHT"                         # Column AI
-        }
+        for i, item in enumerate(master.sample_items):
+            print(f"  Row {i}: '{item}'")
         
-        # Set all column headers in the first row
-        for col_idx, col_name in all_column_mapping.items():
-            output_df.iloc[0, col_idx] = col_name
+        print("\nSecond CSV 'Item' and 'Qty' columns (first 5 rows):")
+        for i in range(min(5, len(first_chunk))):
+            qty_value = first_chunk.iloc[i][column_mappings['Qty']]
+            print(f"  Row {i}: '{first_chunk.iloc[i][column_mappings['Item']]}', Qty: '{qty_value}', type: {type(qty_value)}")
         
-        # Define function to extract Ship to Name from Ship To Address 1 based on rules
-        def extract_ship_to_name(address):
-            if not isinstance(address, str):
-                return ""
-                
-            address = address.strip().upper()
-            
-            # Apply special rules
-            if "BURLINGTON" in address:
-                return "BURLINGTON"
-            elif "SAN BERNARDINO" in address:
-                return "SAN BERNARDINO"
-            elif "MARSHALLS" in address:
-                return "MARSHALLS"
-            elif "TJMAXX" in address or "TJ MAXX" in address or "T.J. MAXX" in address:
-                return "T.J. MAXX"
-            elif "DDS" in address or " DD " in address or address.startswith("DD ") or address.endswith(" DD") or address == "DD":
-                return "DDs"
-            elif "BEALLS" in address:
-                return "BEALLS"
-            elif "ROSS" in address:
-                return "ROSS"
-            elif "FASHION NOVA" in address or "FASHIONNOVA" in address:
-                return "FASHION NOVA"
-            else:
-                # Extract first word (split by whitespace and take first element)
-                first_word = address.split()[0] if address.split() else ""
-                return first_word
-        
-        # Helper function to find closest matching item
-        def find_closest_match(item_normalized, item_data_dict, item_df):
-            # Try exact match first
-            if item_normalized in item_data_dict:
-                return item_data_dict[item_normalized], "exact"
-            
-            # Try partial match
-            for first_item in item_df['normalized_item']:
-                if not first_item:
-                    continue
-                    
-                # If either is contained in the other
-                if item_normalized in first_item or first_item in item_normalized:
-                    return item_data_dict[first_item], "partial"
-            
-            # No match found
-            return None, "none"
-        
-        # Helper function to safely convert string to float
-        def safe_float(value, default=0.0):
-            try:
-                # Clean the value by removing commas and other non-numeric characters
-                if isinstance(value, str):
-                    # Remove commas and other thousands separators
-                    value = value.replace(',', '')
-                    # Replace other potential decimal separators
-                    value = value.replace(' ', '')
-                return float(value) if pd.notna(value) and value != "" else default
-            except (ValueError, TypeError):
-                print(f"Failed to convert '{value}' to float, using default {default}")
-                return default
+        print(f"\nUsing item_data dictionary with {len(master.items)} entries")
         
         # Debug counter for matched/unmatched items
         exact_matches = 0
         partial_matches = 0
         unmatched_items = 0
-        
-        # Process each row of input data and map to output
-        for i, row in input_df.iterrows():
-            # Calculate the corresponding row in output DataFrame (add 1 for header row)
-            output_row = i + 1
-            
-            # Fill in data for each mapped column from step 2
-            output_df.iloc[output_row, 11] = "SENSUAL"  # Customer is always "SENSUAL"
-            output_df.iloc[output_row, 12] = extract_ship_to_name(row[column_mappings["Ship To Address 1"]])
-            output_df.iloc[output_row, 13] = row[column_mappings["Ship Date"]]
-            output_df.iloc[output_row, 14] = row[column_mappings["CANCEL DATE"]]
-            output_df.iloc[output_row, 15] = row[column_mappings["P. O. #"]]
-            output_df.iloc[output_row, 16] = row[column_mappings["Item"]]  # Item/Style
-            output_df.iloc[output_row, 17] = row[column_mappings["Num"]]   # INVOICE #
-            output_df.iloc[output_row, 19] = row[column_mappings["Qty"]]   # TOTAL PIECES
-            
-            # Set UOM to "" for all rows (empty string instead of "10")
-            output_df.iloc[output_row, 20] = ""  # Default value if no match found
-            
-            # Debug print for Qty values
-            if i < 5:  # Print first 5 rows for debugging
-                print(f"Row {i}, Qty: '{row[column_mappings['Qty']]}', type: {type(row[column_mappings['Qty']])}")
-            
-            # Look up and add item data from first CSV if available
-            # Use normalized keys for matching
-            item_key_raw = str(row[column_mappings["Item"]]).strip() if pd.notna(row[column_mappings["Item"]]) else ""
-            item_key_normalized = normalize_item(item_key_raw)
+        rows_processed = 0
+        
+        # Write the header row, then each enriched chunk as soon as it is ready.
+        # The output is built in a temporary file so a failed run never
+        # leaves a partial result behind.
+        with open(temp_path, 'w', encoding='utf-8', newline='') as output_file:
+            writer = csv.writer(output_file, lineterminator=os.linesep)
+            writer.writerow([OUTPUT_940_HEADERS.get(col_idx, "") for col_idx in range(OUTPUT_940_COLUMN_COUNT)])
             
-            # Find best match - either exact or partial
-            item_data_match, match_type = find_closest_match(item_key_normalized, item_data, first_df_original)
-            
-            if item_data_match:
-                if match_type == "exact":
-                    exact_matches += 1
-                else:
-                    partial_matches += 1
-                    
-                # Use the matched item data
-                output_df.iloc[output_row, 20] = item_data_match["qty"]     # UOM from Sequence 10: QTY column
-                output_df.iloc[output_row, 23] = item_data_match["weight"]     # weight w/out add (from Weight)
-                output_df.iloc[output_row, 25] = item_data_match["cube"]       # cube in cm (from Cube)
-                output_df.iloc[output_row, 26] = item_data_match["length"]     # Length
-                output_df.iloc[output_row, 27] = item_data_match["width"]      # Width
-                output_df.iloc[output_row, 28] = item_data_match["height"]     # Height
-                
-                # Calculate derived columns
-                total_pieces = safe_float(row[column_mappings["Qty"]])
-                uom = safe_float(output_df.iloc[output_row, 20])
-                weight_wo_add = safe_float(item_data_match["weight"])
-                length = safe_float(item_data_match["length"])
-                width = safe_float(item_data_match["width"])
-                height = safe_float(item_data_match["height"])
-                
-                # Debug print for calculation values
-                if i < 5:  # Print first 5 rows for debugging
-                    print(f"  Calculation - Row {i}: total_pieces={total_pieces}, uom={uom}")
-                
-                # Calculate Cartons = total pieces / UOM
-                cartons = total_pieces / uom if uom > 0 else 0
-                output_df.iloc[output_row, 21] = f"{cartons:.2f}"
-                
-                # Calculate CARTONS = rounded up Cartons
-                cartons_rounded = math.ceil(cartons)
-                output_df.iloc[output_row, 22] = str(cartons_rounded)
-                
-                # Calculate individual carton weight = weight w/out add + 2
-                individual_weight = weight_wo_add + 2
-                output_df.iloc[output_row, 24] = f"{individual_weight:.2f}"
-                
-                # Calculate dimension = (L * W * H) / 1728
-                dimension = (length * width * height) / 1728 if (length > 0 and width > 0 and height > 0) else 0
-                output_df.iloc[output_row, 29] = f"{dimension:.2f}"
-                
-                # Calculate cube in cft = cube in cm / 1728 + 0.3
-                cube_in_cm = safe_float(item_data_match["cube"])
-                cube_in_cft = (cube_in_cm / 1728) + 0.3
-                output_df.iloc[output_row, 30] = f"{cube_in_cft:.2f}"
-                
-                # Calculate total cubes = cube in cft * CARTONS (using rounded up value)
-                total_cubes = cube_in_cft * cartons_rounded
-                output_df.iloc[output_row, 31] = f"{total_cubes:.2f}"
+            for chunk in itertools.chain([first_chunk], chunks):
+                rows, match_types = build_940_rows(chunk, column_mappings, master, rows_processed, metrics)
+                with timed_stage(metrics, "write") as stage:
+                    written = output_file.tell()
+                    writer.writerows(rows)
+                    stage.add(rows=len(chunk), bytes_written=output_file.tell() - written)
                 
-                # Calculate PALLET = ceil(total_cubes / 65)
-                # 0-64 = 1 pallet, 65-129 = 2 pallets, etc.
-                pallets = math.ceil(total_cubes / 65) if total_cubes > 0 else 1
-                output_df.iloc[output_row, 32] = str(pallets)
+                exact_matches += int((match_types == "exact").sum())
+                partial_matches += int((match_types == "partial").sum())
+                unmatched_items += int((match_types == "none").sum())
+                rows_processed += len(chunk)
                 
-                # Calculate FINAL CUBE = PALLET * 130
-                final_cube = pallets * 130
-                output_df.iloc[output_row, 33] = str(final_cube)
-                
-                # Calculate TOTAL WEIGHT = (CARTONS * individual carton weight) + (PALLET * 40)
-                total_weight = (cartons_rounded * individual_weight) + (pallets * 40)
-                output_df.iloc[output_row, 34] = f"{total_weight:.2f}"
-                
-            else:
-                unmatched_items += 1
-                if i < 10:  # Only print first 10 unmatched items to avoid flooding logs
-                    print(f"Unmatched item: '{item_key_raw}' (normalized: '{item_key_normalized}')")
+                if progress:
+                    progress(rows_processed=rows_processed, exact_matches=exact_matches,
+                             partial_matches=partial_matches, unmatched=unmatched_items)
         
         print(f"Item matching: {exact_matches} exact matches, {partial_matches} partial matches, {unmatched_items} unmatched")
         
-        # Save the DataFrame to the session directory with the output name
-        output_path = os.path.join(session_dir, OUTPUT_CSV_NAME)
-        output_df.to_csv(output_path, index=False, header=False)
-        
-        return True, f"Second CSV processed and merged successfully. Exact matches: {exact_matches}, Partial matches: {partial_matches}, Unmatched: {unmatched_items}"
+        message = f"Second CSV processed and merged successfully. Exact matches: {exact_matches}, Partial matches: {partial_matches}, Unmatched: {unmatched_items}"
+        if result_key is not None:
+            # Cache this run's own file; output_path may be replaced by another job at any time
+            counts = {"rows_processed": rows_processed, "exact_matches": exact_matches,
+                      "partial_matches": partial_matches, "unmatched": unmatched_items}
+            with timed_stage(metrics, "cache_store"):
+                cache.put_file(result_key, temp_path, {"message": message, "counts": counts})
+        os.replace(temp_path, output_path)
+        return True, message
         
     except Exception as e:
         import traceback
         traceback.print_exc()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
         return False, str(e)
 
+def process_940_batch(file_paths, session_dir, batch_dir, combine=True, progress=None, metrics=None):
+    """Process many incoming 940 files against one shared master UOM table.
+    
+    The master is resolved once and the files are merged in parallel by a
+    pool of BATCH_WORKERS threads, each writing its own output CSV in
+    batch_dir. With combine the outputs are joined, in upload order, into a
+    single CSV under one header; otherwise they're packed into a zip.
+    Files that fail are reported in the message without failing the batch.
+    If given, metrics collects the stages of all files, summed across the
+    parallel workers, and the final "combine" stage.
+    """
+    with timed_stage(metrics, "master_load"):
+        master = resolve_master(session_dir)
+    if master is None:
+        return False, NO_UOM_FILE_MESSAGE
+    
+    # Inputs like a.csv and a.xlsx share a stem, so repeated names get a numeric suffix
+    output_paths = []
+    for path in file_paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        output_path = os.path.join(batch_dir, f"{stem}_{OUTPUT_CSV_NAME}")
+        counter = 1
+        while output_path in output_paths:
+            output_path = os.path.join(batch_dir, f"{stem}_{counter}_{OUTPUT_CSV_NAME}")
+            counter += 1
+        output_paths.append(output_path)
+    results = [None] * len(file_paths)
+    file_metrics = [PipelineMetrics(metrics.pipeline) if metrics else None for _ in file_paths]
+    files_done = 0
+    with ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch") as pool:
+        futures = {
+            pool.submit(process_second_csv, path, session_dir,
+                        output_path=output_path, master=master, metrics=file_metrics[i]): i
+            for i, (path, output_path) in enumerate(zip(file_paths, output_paths))
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            if metrics:
+                metrics.merge(file_metrics[futures[future]])
+            files_done += 1
+            if progress:
+                progress(files_done=files_done, files_total=len(file_paths))
+    
+    succeeded = [output_path for output_path, (success, _) in zip(output_paths, results) if success]
+    failures = [f"{os.path.basename(path)}: {message}"
+                for path, (success, message) in zip(file_paths, results) if not success]
+    if not succeeded:
+        return False, f"No files could be processed. {'; '.join(failures)}"
+    
+    with timed_stage(metrics, "combine") as stage:
+        if combine:
+            result_path = os.path.join(batch_dir, OUTPUT_CSV_NAME)
+            temp_path = f"{result_path}.{uuid.uuid4().hex}.tmp"
+            with open(temp_path, 'wb') as combined_file:
+                for i, output_path in enumerate(succeeded):
+                    with open(output_path, 'rb') as output_file:
+                        header = output_file.readline()
+                        if i == 0:
+                            combined_file.write(header)
+                        shutil.copyfileobj(output_file, combined_file)
+        else:
+            result_path = os.path.join(batch_dir, OUTPUT_ZIP_NAME)
+            temp_path = f"{result_path}.{uuid.uuid4().hex}.tmp"
+            with zipfile.ZipFile(temp_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+                for output_path in succeeded:
+                    archive.write(output_path, os.path.basename(output_path))
+        stage.add(bytes_written=os.path.getsize(temp_path))
+    os.replace(temp_path, result_path)
+    
+    message = f"Processed {len(succeeded)} of {len(file_paths)} files."
+    if failures:
+        message += f" Failed: {'; '.join(failures)}"
+    return True, message
+
 def compute_pallet(bol_cube):
     try:
         return str(math.ceil(float(bol_cube) / 40)) if bol_cube else ""
@@ -595,46 +592,17 @@ def compute_final_cube(ship_to_name, pallet):
         return pallet
     return ""
         
-def cleanup_old_files():
-    """Clean up old processing sessions."""
-    import shutil
-    from datetime import datetime, timedelta
-    
-    session_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "processing_sessions")
-    if not os.path.exists(session_dir):
-        return
-        
-    now = datetime.now()
-    for item in os.listdir(session_dir):
-        item_path = os.path.join(session_dir, item)
-        if os.path.isdir(item_path):
-            try:
-                # Check if dir is older than 24 hours
-                created_time = datetime.fromtimestamp(os.path.getctime(item_path))
-                if now - created_time > timedelta(hours=24):
-                    shutil.rmtree(item_path)
-                    print(f"Cleaned up old session: {item}")
-            except Exception as e:
-                print(f"Error cleaning up {item}: {e}")
-
 def get_or_create_session():
     """Get existing session ID or create a new one."""
-    cleanup_old_files()  # First clean up old files
-    import uuid
-    
-    # Create the session directory if it doesn't exist
-    session_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "processing_sessions")
-    if not os.path.exists(session_root):
-        os.makedirs(session_root)
-    
     # If we don't have a session ID yet, create one
     if 'session_id' not in session:
         session['session_id'] = str(uuid.uuid4())
         
     # Create session directory if it doesn't exist
-    session_dir = os.path.join(session_root, session['session_id'])
+    session_dir = os.path.join(SESSIONS_ROOT, session['session_id'])
     if not os.path.exists(session_dir):
         os.makedirs(session_dir)
+        session_index.register(session['session_id'], session_dir)
         
     return session_dir
 
@@ -664,13 +632,38 @@ def process():
 
 @app.route('/health')
 def health():
-    # Simple health check endpoint
-    try:
-        # Check if we can create a session directory
-        session_dir = get_or_create_session()
-        return jsonify({"status": "ok", "message": "Service is healthy", "session_dir": session_dir})
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+    # Simple constant-time health check endpoint
+    return jsonify({"status": "ok", "message": "Service is healthy"})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    # Pipeline stage totals of all server processes, for Prometheus to scrape
+    return Response(metrics_store.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+def new_job_dir(session_dir):
+    """Create and return a directory for one job's files under the session.
+    
+    Jobs of the same session run concurrently, so each keeps its upload and
+    output apart and its download token points at its own output. The
+    directory is removed with the session.
+    """
+    job_dir = os.path.join(session_dir, "results", uuid.uuid4().hex)
+    os.makedirs(job_dir)
+    return job_dir
+
+def run_session_job(func, file_path, session_dir, output_path, progress=None, metrics=None):
+    """Run a process_* function for a session upload, writing to the job's output_path.
+    
+    On success the output is also copied to the session's output CSV, which
+    /download serves when it's called without a token or job ID.
+    """
+    success, message = func(file_path, session_dir, progress=progress, metrics=metrics, output_path=output_path)
+    if success:
+        session_output_path = os.path.join(session_dir, OUTPUT_CSV_NAME)
+        temp_path = f"{session_output_path}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(output_path, temp_path)
+        os.replace(temp_path, session_output_path)
+    return success, message
 
 @app.route('/upload-first-csv', methods=['POST'])
 def upload_first_csv():
@@ -688,17 +681,19 @@ def upload_first_csv():
         return jsonify({"error": "No selected file"}), 400
         
     if file and allowed_file(file.filename, ALLOWED_CSV_EXTENSIONS):
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(session_dir, filename)
+        # Save under the fixed UOM name, replacing an earlier upload of any type
+        ext = file.filename.rsplit('.', 1)[1].lower()
+        previous_path = uploaded_uom_path(session_dir)
+        if previous_path is not None:
+            os.remove(previous_path)
+        file_path = os.path.join(session_dir, f"{UPLOADED_UOM_NAME}.{ext}")
         file.save(file_path)
         
-        # Process the first CSV file
-        success, message = process_first_csv(file_path, session_dir)
-        
-        if success:
-            return jsonify({"status": "success", "message": "First CSV processed successfully"})
-        else:
-            return jsonify({"error": message}), 500
+        # Process the first CSV file in the background
+        output_path = os.path.join(new_job_dir(session_dir), OUTPUT_CSV_NAME)
+        job_id = job_manager.submit("first-csv", run_session_job, process_first_csv, file_path, session_dir,
+                                    output_path, result_path=output_path)
+        return jsonify({"status": "queued", "job_id": job_id}), 202
     else:
         return jsonify({"error": "Invalid file type. Please upload a CSV or Excel file."}), 400
 
@@ -718,58 +713,185 @@ def upload_second_csv():
         return jsonify({"error": "No selected file"}), 400
         
     if file and allowed_file(file.filename, ALLOWED_CSV_EXTENSIONS):
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(session_dir, filename)
+        job_dir = new_job_dir(session_dir)
+        ext = file.filename.rsplit('.', 1)[1].lower()
+        file_path = os.path.join(job_dir, f"input.{ext}")
         file.save(file_path)
         
-        # Process the second CSV file - this will now use the master UOM file if available
-        success, message = process_second_csv(file_path, session_dir)
-        
-        if success:
-            return jsonify({"status": "success", "message": message})
-        else:
-            return jsonify({"error": message}), 500
+        # Process the second CSV file in the background - this will use the master UOM file if available
+        output_path = os.path.join(job_dir, OUTPUT_CSV_NAME)
+        job_id = job_manager.submit("second-csv", run_session_job, process_second_csv, file_path, session_dir,
+                                    output_path, result_path=output_path)
+        return jsonify({"status": "queued", "job_id": job_id}), 202
     else:
         return jsonify({"error": "Invalid file type. Please upload a CSV or Excel file."}), 400
 
+def save_batch_uploads(files, input_dir):
+    """Save uploaded 940 files, unpacking zips, and return the saved paths.
+    
+    Zip members are flattened to their secure base names, skipping anything
+    that isn't a CSV or Excel file. Repeated names get a numeric suffix.
+    
+    Raises:
+        ValueError: If zips unpack to more than BATCH_MAX_FILES files, or
+            a member or all members together are larger uncompressed than
+            BATCH_MAX_FILE_BYTES or BATCH_MAX_TOTAL_BYTES.
+    """
+    saved_paths = []
+    unpacked_files = 0
+    unpacked_bytes = 0
+    
+    def unique_path(filename):
+        stem, ext = os.path.splitext(secure_filename(filename))
+        if not ext:
+            # secure_filename drops names made only of non-ASCII characters
+            ext = "." + filename.rsplit('.', 1)[1].lower()
+        path = os.path.join(input_dir, f"{stem}{ext}")
+        counter = 1
+        while os.path.exists(path):
+            path = os.path.join(input_dir, f"{stem}_{counter}{ext}")
+            counter += 1
+        return path
+    
+    for file in files:
+        if allowed_file(file.filename, {'zip'}):
+            with zipfile.ZipFile(file.stream) as archive:
+                for member in archive.infolist():
+                    name = os.path.basename(member.filename)
+                    if member.is_dir() or name.startswith('.') or not allowed_file(name, ALLOWED_CSV_EXTENSIONS):
+                        continue
+                    unpacked_files += 1
+                    if unpacked_files > BATCH_MAX_FILES:
+                        raise ValueError(f"Zip files may contain at most {BATCH_MAX_FILES} CSV or Excel files.")
+                    path = unique_path(name)
+                    saved_paths.append(path)
+                    # Sizes in the zip directory can lie, so count the bytes actually unpacked
+                    member_bytes = 0
+                    with archive.open(member) as source, open(path, 'wb') as target:
+                        for block in iter(lambda: source.read(1024 * 1024), b""):
+                            member_bytes += len(block)
+                            unpacked_bytes += len(block)
+                            if member_bytes > BATCH_MAX_FILE_BYTES:
+                                raise ValueError(f"{name} is larger than {BATCH_MAX_FILE_BYTES // (1024 * 1024)} MB unpacked.")
+                            if unpacked_bytes > BATCH_MAX_TOTAL_BYTES:
+                                raise ValueError(f"Zip files are larger than {BATCH_MAX_TOTAL_BYTES // (1024 * 1024)} MB unpacked.")
+                            target.write(block)
+        elif allowed_file(file.filename, ALLOWED_CSV_EXTENSIONS):
+            path = unique_path(file.filename)
+            file.save(path)
+            saved_paths.append(path)
+    return saved_paths
+
+@app.route('/upload-940-batch', methods=['POST'])
+def upload_940_batch():
+    """Queue a batch of incoming 940 files (CSV/Excel files or zips of them).
+    
+    The "output" form field selects "combined" (default) for one merged CSV
+    or "per-file" for a zip with one output CSV per input file.
+    """
+    session_dir = get_or_create_session()
+    
+    files = [file for file in request.files.getlist('files') if file.filename]
+    if not files:
+        return jsonify({"error": "No selected files"}), 400
+    
+    output_mode = request.form.get('output', 'combined')
+    if output_mode not in ('combined', 'per-file'):
+        return jsonify({"error": "output must be 'combined' or 'per-file'"}), 400
+    
+    # Each batch gets its own directory so its inputs aren't mistaken for a UOM upload
+    batch_dir = os.path.join(session_dir, f"batch_{uuid.uuid4().hex}")
+    input_dir = os.path.join(batch_dir, "inputs")
+    os.makedirs(input_dir)
+    try:
+        file_paths = save_batch_uploads(files, input_dir)
+    except zipfile.BadZipFile:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        return jsonify({"error": "Invalid zip file."}), 400
+    except ValueError as e:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        return jsonify({"error": str(e)}), 400
+    
+    if not file_paths:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        return jsonify({"error": "No CSV or Excel files found in the upload."}), 400
+    
+    combine = output_mode == 'combined'
+    result_path = os.path.join(batch_dir, OUTPUT_CSV_NAME if combine else OUTPUT_ZIP_NAME)
+    job_id = job_manager.submit("940-batch", process_940_batch, file_paths, session_dir, batch_dir, combine,
+                                result_path=result_path)
+    return jsonify({"status": "queued", "job_id": job_id, "files": len(file_paths)}), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report a background job's status, progress counts and result."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    
+    job = dict(job)
+    job.pop('result_path', None)  # Don't expose server paths
+    token = job.pop('download_token', None)
+    if job['status'] == 'done' and token:
+        job['download_url'] = f"/download?token={token}"
+    return jsonify(job)
+
+def send_result(file_path):
+    """Send a processed CSV, as XLSX if ?format=xlsx, compressed when the client accepts it."""
+    download_name = os.path.basename(file_path)
+    if download_name.endswith(".zip"):
+        # Batch archives are already compressed
+        return send_file(file_path, as_attachment=True, download_name=download_name)
+    
+    if request.args.get('format') == 'xlsx':
+        download_name = os.path.splitext(download_name)[0] + ".xlsx"
+        return send_file(xlsx_path_for(file_path), as_attachment=True, download_name=download_name)
+    
+    encoding = request.accept_encodings.best_match(SUPPORTED_ENCODINGS)
+    if encoding is None:
+        return send_file(file_path, as_attachment=True, download_name=download_name)
+    
+    # Stream the compressed file in chunks rather than compressing it up front
+    response = Response(
+        stream_with_context(iter_compressed(iter_file(file_path), encoding)),
+        mimetype='text/csv'
+    )
+    response.headers['Content-Encoding'] = encoding
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    response.headers.add('Vary', 'Accept-Encoding')
+    return response
+
 @app.route('/download')
 def download_file():
-    # First try with the current session directory
+    # A download token identifies the result directly, even if the cookie session was lost
+    token = request.args.get('token')
+    if token:
+        file_path = result_registry.lookup(token)
+        if file_path and os.path.exists(file_path):
+            return send_result(file_path)
+        return jsonify({"error": "File not found. Please process your data first."}), 404
+    
+    # A job ID reports jobs that haven't produced a result yet
+    job_id = request.args.get('job_id')
+    if job_id:
+        job = job_manager.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        if job['status'] in ('queued', 'running'):
+            return jsonify({"error": "Job is still processing", "status": job['status']}), 409
+        if job['status'] == 'failed':
+            return jsonify({"error": job['error']}), 500
+        if job['result_path'] and os.path.exists(job['result_path']):
+            return send_result(job['result_path'])
+        return jsonify({"error": "File not found. Please process your data first."}), 404
+    
+    # Otherwise serve the current session's own output
     session_dir = get_or_create_session()
     
     file_path = os.path.join(session_dir, OUTPUT_CSV_NAME)
     if os.path.exists(file_path):
-        return send_file(file_path, as_attachment=True, download_name=OUTPUT_CSV_NAME)
-    
-    # If not found, look in all recent session directories (within the last hour)
-    # This is a fallback for iframe issues where session might be lost
-    session_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "processing_sessions")
-    if os.path.exists(session_root):
-        # Check for processed files in recent sessions
-        from datetime import datetime, timedelta
-        now = datetime.now()
-        one_hour_ago = now - timedelta(hours=1)
-        
-        # Sort directories by creation time, newest first
-        session_dirs = []
-        for item in os.listdir(session_root):
-            item_path = os.path.join(session_root, item)
-            if os.path.isdir(item_path):
-                created_time = datetime.fromtimestamp(os.path.getctime(item_path))
-                if now - created_time < timedelta(hours=1):  # Only check recent sessions
-                    session_dirs.append((item_path, created_time))
-        
-        # Sort by creation time, newest first
-        session_dirs.sort(key=lambda x: x[1], reverse=True)
-        
-        # Check each session directory for the output file
-        for session_dir_path, _ in session_dirs:
-            check_file = os.path.join(session_dir_path, OUTPUT_CSV_NAME)
-            if os.path.exists(check_file):
-                print(f"Found file in alternate session directory: {session_dir_path}")
-                return send_file(check_file, as_attachment=True, download_name=OUTPUT_CSV_NAME)
-    
-    # If still not found, return error
+        return send_result(file_path)
+    
     return jsonify({"error": "File not found. Please process your data first."}), 404
 
 @app.after_request
@@ -803,55 +925,61 @@ def upload_master_uom():
         return jsonify({"error": "No selected file"}), 400
         
     if file and allowed_file(file.filename, ALLOWED_CSV_EXTENSIONS):
-        # Backup the existing master file if it exists
-        if os.path.exists(MASTER_UOM_FILE):
-            backup_file = f"{MASTER_UOM_FILE}.bak"
-            shutil.copy2(MASTER_UOM_FILE, backup_file)
-            
-        # Save the new master file
-        file.save(MASTER_UOM_FILE)
+        # Save the upload beside the store; it's validated and published from there
+        ext = file.filename.rsplit('.', 1)[1].lower()
+        upload_path = os.path.join(MASTER_DATA_DIR, f".upload.{uuid.uuid4().hex}.{ext}")
+        file.save(upload_path)
         
-        # Verify the file can be read and has the required columns
         try:
-            ext = os.path.splitext(MASTER_UOM_FILE)[1].lower()
-            if ext == ".csv":
-                df = pd.read_csv(MASTER_UOM_FILE, dtype=str)
-            elif ext in [".xlsx", ".xls"]:
-                df = pd.read_excel(MASTER_UOM_FILE, dtype=str)
-                
-            required_columns = ["Item #", "Weight", "Cube", "Length", "Width", "Height"]
-            missing_columns = []
-            
-            for col in required_columns:
-                try:
-                    matched_col = find_matching_column(df, col, required=True)
-                except ValueError:
-                    missing_columns.append(col)
-            
-            if missing_columns:
-                # Restore from backup if validation fails
-                if os.path.exists(f"{MASTER_UOM_FILE}.bak"):
-                    shutil.copy2(f"{MASTER_UOM_FILE}.bak", MASTER_UOM_FILE)
-                return jsonify({"error": f"Uploaded file is missing required columns: {', '.join(missing_columns)}"}), 400
-                
-            return jsonify({"status": "success", "message": "Master UOM file updated successfully"})
-            
+            master = master_uom_store.publish(upload_path)
+        except ValueError as e:
+            return jsonify({"error": f"Invalid master UOM file: {str(e)}"}), 400
         except Exception as e:
-            # Restore from backup if validation fails
-            if os.path.exists(f"{MASTER_UOM_FILE}.bak"):
-                shutil.copy2(f"{MASTER_UOM_FILE}.bak", MASTER_UOM_FILE)
             return jsonify({"error": f"Error validating uploaded file: {str(e)}"}), 500
+        finally:
+            os.remove(upload_path)
+        
+        master_uom_cache.invalidate()
+        return jsonify({
+            "status": "success",
+            "message": "Master UOM file updated successfully",
+            "version": master.version
+        })
     else:
         return jsonify({"error": "Invalid file type. Please upload a CSV or Excel file."}), 400
 
 @app.route('/admin/download-master-uom')
 def download_master_uom():
-    """Admin endpoint to download the current master UOM file"""
+    """Admin endpoint to download the current master UOM file, or a kept version"""
+    version = request.args.get('version')
+    if version:
+        version_path = master_uom_store.version_path(version)
+        if version_path is None:
+            return jsonify({"error": "Master UOM version not found"}), 404
+        return send_file(version_path, as_attachment=True, download_name=f"master_uom.{version}.csv")
+    
     if os.path.exists(MASTER_UOM_FILE):
         return send_file(MASTER_UOM_FILE, as_attachment=True, download_name="master_uom.csv")
     else:
         return jsonify({"error": "Master UOM file not found. Please upload one first."}), 404
 
+@app.route('/admin/header-aliases', methods=['GET', 'POST'])
+def header_aliases():
+    """Admin endpoint to list confirmed header aliases, or confirm new ones
+    
+    POST a JSON object of target column -> header, e.g.
+    {"P. O. #": "PO Number"}, to have that header matched to the target
+    in every later upload.
+    """
+    if request.method == 'POST':
+        mappings = request.get_json(silent=True)
+        if (not isinstance(mappings, dict) or not mappings
+                or not all(isinstance(target, str) and isinstance(header, str) and header.strip()
+                           for target, header in mappings.items())):
+            return jsonify({"error": "Send a JSON object of target column -> header name"}), 400
+        header_resolver.confirm(mappings)
+    return jsonify(header_resolver.aliases())
+
 @app.route('/admin')
 def admin_page():
     """Admin page for managing the master UOM file"""
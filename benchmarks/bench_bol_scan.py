@@ -0,0 +1,53 @@
+"""Benchmark BOL page parsing: single-pass scan_page vs the per-field methods.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_bol_scan --pages 2000
+"""
+import argparse
+import time
+from benchmarks.synthetic import bol_packet
+from data_processor import DataProcessor, scan_page
+
+def legacy_scan(processor, content):
+    """Parse a page with the separate per-field methods."""
+    invoice_no = processor._get_invoice_no(content)
+    table_data = processor._extract_table_data(content)
+    bol_cube = processor._extract_bol_cube(content)
+    return invoice_no, table_data, bol_cube
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=2000, help="Synthetic pages to parse")
+    parser.add_argument("--rows", type=int, default=25, help="Table rows per page")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions (best is reported)")
+    args = parser.parse_args()
+
+    pages = ["\n".join(lines) for lines in bol_packet(
+        invoices=(args.pages + 1) // 2, pages_per_invoice=2, rows_per_page=args.rows)[:args.pages]]
+    # Parse methods don't touch the session directory
+    processor = DataProcessor.__new__(DataProcessor)
+
+    for content in pages:
+        invoice_no, table_data, bol_cube = legacy_scan(processor, content)
+        page = scan_page(content)
+        rows, has_totals, totals = table_data
+        assert (page.invoice_no, page.rows, page.has_totals, page.totals, page.bol_cube) == \
+            (invoice_no, rows, has_totals, totals, bol_cube), "scan_page disagrees with legacy parsing"
+
+    def best_time(parse):
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for content in pages:
+                parse(content)
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    legacy = best_time(lambda content: legacy_scan(processor, content))
+    single = best_time(scan_page)
+    print(f"pages: {len(pages)}, rows/page: {args.rows}")
+    print(f"legacy:    {legacy * 1e6 / len(pages):8.1f} us/page")
+    print(f"scan_page: {single * 1e6 / len(pages):8.1f} us/page  ({legacy / single:.1f}x faster)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Benchmark locating a download: scanning session directories vs the result registry.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_download_lookup --sessions 10000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+from config import OUTPUT_CSV_NAME
+from session_store import ResultRegistry
+
+def scan_sessions(session_root):
+    """Find an output file the way /download used to: newest recent session first."""
+    now = time.time()
+    session_dirs = []
+    for item in os.listdir(session_root):
+        item_path = os.path.join(session_root, item)
+        if os.path.isdir(item_path):
+            created_time = os.path.getctime(item_path)
+            if now - created_time < 3600:
+                session_dirs.append((item_path, created_time))
+    session_dirs.sort(key=lambda x: x[1], reverse=True)
+    for session_dir_path, _ in session_dirs:
+        check_file = os.path.join(session_dir_path, OUTPUT_CSV_NAME)
+        if os.path.exists(check_file):
+            return check_file
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10000, help="Live session directories")
+    parser.add_argument("--with-output", type=float, default=0.5,
+                        help="Fraction of sessions holding a finished output file")
+    parser.add_argument("--lookups", type=int, default=1000, help="Registry lookups to time")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        session_root = os.path.join(tmp_dir, "processing_sessions")
+        os.makedirs(session_root)
+        registry = ResultRegistry(os.path.join(tmp_dir, "processing_sessions.db"))
+
+        tokens = []
+        for _ in range(args.sessions):
+            session_dir = os.path.join(session_root, str(uuid.uuid4()))
+            os.makedirs(session_dir)
+            if random.random() < args.with_output:
+                output_path = os.path.join(session_dir, OUTPUT_CSV_NAME)
+                with open(output_path, "w") as output_file:
+                    output_file.write("Order Number\n")
+                tokens.append(registry.register(output_path))
+
+        start = time.perf_counter()
+        assert scan_sessions(session_root) is not None
+        scan = time.perf_counter() - start
+
+        sample = [random.choice(tokens) for _ in range(args.lookups)]
+        start = time.perf_counter()
+        for token in sample:
+            assert os.path.exists(registry.lookup(token))
+        lookup = (time.perf_counter() - start) / len(sample)
+
+        print(f"sessions: {args.sessions}, results: {len(tokens)}")
+        print(f"directory scan:  {scan * 1e3:10.2f} ms/download")
+        print(f"registry lookup: {lookup * 1e3:10.3f} ms/download  ({scan / lookup:.0f}x faster)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""Benchmark PDF text extraction throughput for different worker counts.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_pdf_extract --pages 200 --workers 1 2 4
+"""
+import argparse
+import os
+import tempfile
+import time
+from benchmarks.synthetic import bol_packet, write_text_pdf
+from pdf_processor import iter_page_texts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200, help="Pages in the synthetic packet")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}),
+                        help="Worker counts to compare")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = os.path.join(tmp_dir, "packet.pdf")
+        write_text_pdf(pdf_path, bol_packet(invoices=(args.pages + 1) // 2, pages_per_invoice=2)[:args.pages])
+
+        baseline = None
+        print(f"{'workers':>8} {'seconds':>9} {'pages/sec':>10} {'speedup':>8}")
+        for workers in args.workers:
+            start = time.perf_counter()
+            page_count = sum(1 for _ in iter_page_texts(pdf_path, workers))
+            elapsed = time.perf_counter() - start
+            rate = page_count / elapsed
+            baseline = baseline or rate
+            print(f"{workers:>8} {elapsed:>9.2f} {rate:>10.1f} {rate / baseline:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
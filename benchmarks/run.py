@@ -0,0 +1,178 @@
+"""Run the processing pipelines on synthetic inputs and report throughput, peak RSS and stage timings.
+
+Each pipeline runs at every size in a fresh process, so peak RSS belongs
+to that run alone. Inputs are generated from fixed seeds, so results can
+be compared across commits.
+
+Usage (from the repository root, with the app's environment set up):
+    python -m benchmarks.run --sizes 1000 10000 --output before.json
+    python -m benchmarks.run --sizes 1000 10000 --compare before.json
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from benchmarks.synthetic import bol_packet, master_uom_rows, rows_940, write_table
+
+PIPELINES = ["uom", "940-csv", "940-xlsx", "bol"]
+BOL_ROWS_PER_PAGE = 20
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and KiB elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def generate_inputs(pipeline, size, master_items, input_dir):
+    """Write the input files of one case and return their paths."""
+    master_path = os.path.join(input_dir, "master_uom.csv")
+    if pipeline == "uom":
+        write_table(master_path, master_uom_rows(size))
+        return {"input": master_path}
+
+    if pipeline in ("940-csv", "940-xlsx"):
+        write_table(master_path, master_uom_rows(master_items))
+        input_path = os.path.join(input_dir, "940.xlsx" if pipeline == "940-xlsx" else "940.csv")
+        write_table(input_path, rows_940(size, master_items))
+        return {"input": input_path, "master": master_path}
+
+    pages_dir = os.path.join(input_dir, "pages")
+    os.makedirs(pages_dir)
+    pages = math.ceil(size / BOL_ROWS_PER_PAGE)
+    packet = bol_packet(invoices=math.ceil(pages / 2), pages_per_invoice=2, rows_per_page=BOL_ROWS_PER_PAGE)
+    for page_number, lines in enumerate(packet[:pages], start=1):
+        with open(os.path.join(pages_dir, f"{page_number}.txt"), "w", encoding="utf-8") as page_file:
+            page_file.write("\n".join(lines))
+    return {"input": pages_dir}
+
+def run_case(pipeline, size, inputs, work_dir):
+    """Run one pipeline on generated inputs; called in a fresh process."""
+    # The pipelines log every page and chunk; keep that out of the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return _run_case(pipeline, size, inputs, work_dir)
+
+def _run_case(pipeline, size, inputs, work_dir):
+    from metrics import PipelineMetrics, timed_stage
+    metrics = PipelineMetrics(pipeline)
+    start_rss = peak_rss_mb()
+
+    if pipeline == "bol":
+        from data_processor import DataProcessor
+        from output_sink import CSVSink
+        from config import OUTPUT_CSV_NAME
+        processor = DataProcessor(session_id=f"bench_{os.getpid()}", metrics=metrics)
+        try:
+            for name in os.listdir(inputs["input"]):
+                shutil.copy(os.path.join(inputs["input"], name), processor.session_dir)
+            start = time.perf_counter()
+            with CSVSink(os.path.join(processor.session_dir, OUTPUT_CSV_NAME)) as sink:
+                success = processor.process_all_files(sink) and sink.rows_written > 0
+            seconds = time.perf_counter() - start
+            message = "" if success else "BOL processing failed"
+        finally:
+            shutil.rmtree(processor.session_dir, ignore_errors=True)
+    else:
+        from app import process_first_csv, process_second_csv
+        from master_data import MasterUOM
+        start = time.perf_counter()
+        if pipeline == "uom":
+            success, message = process_first_csv(inputs["input"], work_dir, metrics=metrics)
+        else:
+            with timed_stage(metrics, "master_load"):
+                master = MasterUOM.load(inputs["master"])
+            # Inputs repeat across runs (fixed seeds), so bypass the result cache
+            success, message = process_second_csv(inputs["input"], work_dir, master=master, metrics=metrics,
+                                                  cache=None)
+        seconds = time.perf_counter() - start
+
+    if not success:
+        raise RuntimeError(f"{pipeline} at size {size} failed: {message}")
+    return {
+        "pipeline": pipeline,
+        "size": size,
+        "seconds": seconds,
+        "rows_per_second": size / seconds if seconds else None,
+        "start_rss_mb": start_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": metrics.to_dict()["stages"],
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline):
+    """Print each case's throughput and peak RSS against a previous report (to stderr, like progress)."""
+    previous = {(case["pipeline"], case["size"]): case for case in baseline["results"]}
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'}:", file=sys.stderr)
+    print(f"{'pipeline':>10} {'size':>8} {'rows/s':>10} {'before':>10} {'change':>8} {'peak MiB':>9} {'before':>8}",
+          file=sys.stderr)
+    for case in results:
+        before = previous.get((case["pipeline"], case["size"]))
+        if before is None:
+            continue
+        change = case["rows_per_second"] / before["rows_per_second"]
+        print(f"{case['pipeline']:>10} {case['size']:>8} {case['rows_per_second']:>10.0f} "
+              f"{before['rows_per_second']:>10.0f} {change:>7.2f}x "
+              f"{case['peak_rss_mb']:>9.1f} {before['peak_rss_mb']:>8.1f}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pipelines", nargs="+", choices=PIPELINES, default=PIPELINES,
+                        help="Pipelines to run")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000],
+                        help="Rows per run (UOM items, 940 lines or BOL table rows)")
+    parser.add_argument("--master-items", type=int, default=20000,
+                        help="Items in the master UOM the 940 runs match against")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="Previous JSON report to compare throughput with")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for pipeline in args.pipelines:
+            for size in args.sizes:
+                case_dir = os.path.join(tmp_dir, f"{pipeline}_{size}")
+                os.makedirs(case_dir)
+                inputs = generate_inputs(pipeline, size, args.master_items, case_dir)
+                # A new process per case keeps peak RSS from carrying over
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                    case = executor.submit(run_case, pipeline, size, inputs, case_dir).result()
+                results.append(case)
+                print(f"{pipeline:>10} {size:>8} rows: {case['seconds']:8.2f} s "
+                      f"{case['rows_per_second']:10.0f} rows/s  peak {case['peak_rss_mb']:.1f} MiB",
+                      file=sys.stderr)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "master_items": args.master_items,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as baseline_file:
+            compare(results, json.load(baseline_file))
+
+if __name__ == "__main__":
+    main()
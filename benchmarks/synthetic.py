@@ -0,0 +1,148 @@
+"""Generators for synthetic BOL pages, PDFs, 940 files and UOM tables used by the benchmarks."""
+import csv
+import random
+from openpyxl import Workbook
+
+def bol_page_lines(invoice_no, rows, with_totals, seed=0):
+    """Build the text lines of one BOL page.
+
+    Args:
+        invoice_no: Invoice number printed after "BILL OF LADING"
+        rows: Number of carton rows in the table
+        with_totals: Whether the page ends the invoice with a TOTAL CARTONS line
+        seed: Seed for the generated row values
+    """
+    rng = random.Random(seed)
+    lines = [
+        f"STRAIGHT BILL OF LADING {invoice_no}",
+        "SHIP FROM: SENSUAL INC 1234 INDUSTRY WAY LOS ANGELES CA 90021",
+        "SHIP TO: BURLINGTON DC 1830 ROUTE 130 BURLINGTON NJ 08016",
+        "CARRIER: ACME FREIGHT SCAC: ACMF PRO: 123456789",
+        "",
+        "CARTONS STYLE PIECES DESCRIPTION WEIGHT",
+    ]
+    total_cartons = 0
+    total_pieces = 0
+    for _ in range(rows):
+        cartons = rng.randint(1, 40)
+        pieces = cartons * rng.choice([6, 12, 24, 36])
+        total_cartons += cartons
+        total_pieces += pieces
+        style = f"{rng.randint(1000, 9999)}-{rng.randint(100, 999)}-{rng.choice(['BLK', 'RED', 'NVY'])}"
+        lines.append(f"{cartons} {style} {pieces:,} LADIES KNIT TOP {cartons * 11.5:,.1f}")
+    if with_totals:
+        lines.append(
+            f"{total_cartons} TOTAL CARTONS {total_pieces:,} TOTAL PIECES "
+            f"TOTAL VOL / WGT {total_cartons * 11.5:,.1f}"
+        )
+        lines.append(f"{rng.uniform(10, 999):.2f}")
+        lines.append("SHIPPING INSTRUCTIONS:")
+        lines.append("DO NOT DOUBLE STACK")
+    return lines
+
+def bol_packet(invoices, pages_per_invoice=2, rows_per_page=20, seed=0):
+    """Build a list of pages (each a list of lines) for a BOL packet."""
+    pages = []
+    for invoice in range(invoices):
+        invoice_no = f"S{1000000 + invoice}"
+        for page in range(pages_per_invoice):
+            pages.append(bol_page_lines(
+                invoice_no, rows_per_page, page == pages_per_invoice - 1,
+                seed=seed * 100003 + invoice * 101 + page
+            ))
+    return pages
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_text_pdf(path, pages, font_size=8):
+    """Write a minimal PDF with one text page per list of lines."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page objects are numbered
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for lines in pages:
+        leading = font_size + 2
+        content = [f"BT /F1 {font_size} Tf {leading} TL 36 756 Td"]
+        for line in lines:
+            content.append(f"({_pdf_escape(line)}) Tj T*")
+        content.append("ET")
+        stream = "\n".join(content).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode("latin-1")
+
+    with open(path, "wb") as pdf:
+        pdf.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(pdf.tell())
+            pdf.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref_offset = pdf.tell()
+        pdf.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            pdf.write(b"%010d 00000 n \n" % offset)
+        pdf.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                  % (len(objects) + 1, xref_offset))
+
+UOM_HEADER = ["Item #", "Sequence 10: QTY", "Weight", "Cube", "Length", "Width", "Height"]
+HEADER_940 = ["Num", "Ship Date", "P. O. #", "CANCEL DATE", "Item", "Qty", "Ship To Address 1"]
+SHIP_TO_ADDRESSES = ["BURLINGTON #1830", "ROSS DD 0552", "T.J. MAXX 0921", "MARSHALLS 0417",
+                     "BEALLS OUTLET 12", "FASHION NOVA DC", "ACME STORES 7"]
+
+def master_item(index):
+    """Return the item number of the index-th synthetic master item."""
+    return f"{1000 + index % 9000:04d}-{100 + index // 9000:03d}-{'ABCDEFGHJK'[index % 10]}Z"
+
+def master_uom_rows(items, seed=0):
+    """Build the rows (header first) of a master UOM table with the given number of items."""
+    rng = random.Random(seed)
+    rows = [UOM_HEADER]
+    for index in range(items):
+        length, width, height = rng.randint(10, 30), rng.randint(8, 20), rng.randint(4, 16)
+        rows.append([
+            master_item(index), str(rng.choice([6, 12, 24, 36, 48])), str(rng.randint(5, 40)),
+            f"{length * width * height:,.2f}", str(length), str(width), str(height),
+        ])
+    return rows
+
+def rows_940(rows, master_items, seed=0, partial=0.1, unmatched=0.05):
+    """Build the rows (header first) of an incoming 940 referencing a master of master_items items.
+
+    Most lines use a master item as is; a share uses a longer variant that
+    only matches partially and a share uses items the master doesn't have.
+    """
+    rng = random.Random(seed)
+    lines = [HEADER_940]
+    for line in range(rows):
+        roll = rng.random()
+        item = master_item(rng.randrange(master_items))
+        if roll < unmatched:
+            item = f"X{rng.randint(100000, 999999)}"
+        elif roll < unmatched + partial:
+            item = f"{item}-{rng.choice(['S', 'M', 'L'])}"
+        lines.append([
+            f"INV{line // 20:07d}", "01/02/2024", f"PO{line // 50:06d}", "01/30/2024",
+            item, str(rng.choice([12, 24, 48, 96, 144, 1200])), rng.choice(SHIP_TO_ADDRESSES),
+        ])
+    return lines
+
+def write_table(path, rows):
+    """Write rows (header first) as a CSV or, for a .xlsx path, a workbook."""
+    if path.endswith(".xlsx"):
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        for row in rows:
+            sheet.append(row)
+        workbook.save(path)
+        return
+    with open(path, "w", newline="", encoding="utf-8") as table_file:
+        csv.writer(table_file).writerows(rows)
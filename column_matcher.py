@@ -0,0 +1,181 @@
+import os
+import re
+import json
+import uuid
+import threading
+from collections import OrderedDict
+from difflib import get_close_matches
+
+# Learned header aliases, kept beside the master UOM
+HEADER_ALIASES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "master_data", "header_aliases.json")
+
+# Header layouts whose resolved columns are kept in memory
+HEADER_CACHE_SIZE = 256
+
+# Helper function to normalize column headers for matching
+def normalize_header(header):
+    if not isinstance(header, str):
+        return ""
+    # Convert to lowercase
+    header = str(header).lower()
+    # Remove special characters and extra spaces
+    header = re.sub(r'[^a-z0-9]', '', header)
+    return header
+
+def _match_column(columns, normalized_headers, target_column, aliases=()):
+    """Return the column that best matches target_column, or None.
+
+    Args:
+        columns: Column names of the file
+        normalized_headers: normalize_header(col) -> col for those columns
+        target_column: The target column name to find
+        aliases: Headers previously confirmed for target_column, tried
+            before fuzzy matching
+    """
+    # If the column exists exactly as specified, use it
+    if target_column in columns:
+        return target_column
+
+    # Look for exact match with normalized headers
+    normalized_target = normalize_header(target_column)
+    if normalized_target in normalized_headers:
+        return normalized_headers[normalized_target]
+
+    # Then for a header this target has been matched to before
+    for alias in aliases:
+        normalized_alias = normalize_header(alias)
+        if normalized_alias in normalized_headers:
+            return normalized_headers[normalized_alias]
+
+    # Try to find the closest match
+    matches = get_close_matches(normalized_target, normalized_headers.keys(), n=1, cutoff=0.6)
+
+    if matches:
+        matched_header = normalized_headers[matches[0]]
+        print(f"Matched '{target_column}' to '{matched_header}' in the uploaded file")
+        return matched_header
+
+    return None
+
+class HeaderResolver:
+    """Resolves required columns against file headers, remembering what it has seen.
+
+    Results are cached per header layout, so a layout seen before resolves
+    with one dict lookup. Fuzzy matches only live in that in-memory cache;
+    a wrong guess is never saved. Mappings an administrator confirms (see
+    /admin/header-aliases) are saved to a JSON alias table, so they survive
+    restarts, are shared between server processes and are tried before
+    fuzzy matching. That's also how mappings fuzzy matching can't find
+    (e.g. "PO Number" for "P. O. #") are added.
+    """
+
+    def __init__(self, alias_path, cache_size=HEADER_CACHE_SIZE):
+        """Initialize the resolver.
+
+        Args:
+            alias_path: JSON file holding target column -> confirmed headers
+            cache_size: Number of header layouts to keep resolved in memory
+        """
+        self.alias_path = alias_path
+        self.cache_size = cache_size
+        self._aliases = {}
+        self._aliases_stamp = None
+        self._layouts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _refresh_aliases(self):
+        """Reload the alias table if another process has changed it. Call with the lock held."""
+        try:
+            stat = os.stat(self.alias_path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stamp = None
+        if stamp == self._aliases_stamp:
+            return
+
+        aliases = {}
+        if stamp is not None:
+            try:
+                with open(self.alias_path, 'r', encoding='utf-8') as alias_file:
+                    aliases = json.load(alias_file)
+            except (OSError, ValueError) as e:
+                print(f"Error reading header aliases: {e}")
+        self._aliases = aliases
+        self._aliases_stamp = stamp
+        # Layouts resolved without the new aliases may now resolve differently
+        self._layouts.clear()
+
+    def resolve(self, columns, targets):
+        """Match each target column to one of the given columns.
+
+        Args:
+            columns: Column names of the uploaded file
+            targets: Column names to find
+
+        Returns:
+            Dict of target -> matched column, with None for targets that
+            could not be matched
+        """
+        key = (tuple(columns), tuple(targets))
+        with self._lock:
+            self._refresh_aliases()
+            resolved = self._layouts.get(key)
+            if resolved is not None:
+                self._layouts.move_to_end(key)
+                return dict(resolved)
+            aliases = self._aliases
+
+        normalized_headers = {normalize_header(col): col for col in key[0]}
+        resolved = {target: _match_column(key[0], normalized_headers, target, aliases.get(target, ()))
+                    for target in targets}
+
+        with self._lock:
+            self._layouts[key] = resolved
+            while len(self._layouts) > self.cache_size:
+                self._layouts.popitem(last=False)
+        return dict(resolved)
+
+    def aliases(self):
+        """Return the confirmed alias table as a dict of target column -> headers."""
+        with self._lock:
+            self._refresh_aliases()
+            return {target: list(headers) for target, headers in self._aliases.items()}
+
+    def confirm(self, column_mappings):
+        """Save confirmed header mappings as aliases for later uploads.
+
+        Only called for mappings a person has confirmed; resolve() never
+        saves its own fuzzy matches. Mappings that equal the target after
+        normalization are skipped, as they resolve without help.
+
+        Args:
+            column_mappings: Dict of target column -> confirmed header
+        """
+        new_aliases = {target: header for target, header in column_mappings.items()
+                       if isinstance(header, str) and normalize_header(header) != normalize_header(target)}
+        if not new_aliases:
+            return
+
+        with self._lock:
+            self._refresh_aliases()
+            aliases = {target: list(headers) for target, headers in self._aliases.items()}
+            changed = False
+            for target, header in new_aliases.items():
+                known = aliases.setdefault(target, [])
+                if normalize_header(header) not in map(normalize_header, known):
+                    known.append(header)
+                    changed = True
+                    print(f"Confirmed header alias '{header}' for '{target}'")
+            if not changed:
+                return
+
+            # Write atomically so other processes never read a partial table
+            os.makedirs(os.path.dirname(self.alias_path), exist_ok=True)
+            temp_path = f"{self.alias_path}.{uuid.uuid4().hex}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as alias_file:
+                json.dump(aliases, alias_file, indent=2, sort_keys=True)
+            os.replace(temp_path, self.alias_path)
+            self._refresh_aliases()
+
+# Shared resolver used by the upload handlers and the master UOM loader
+header_resolver = HeaderResolver(HEADER_ALIASES_FILE)
@@ -13,6 +13,32 @@ else:
 
 # File Processing
 OUTPUT_CSV_NAME = "940IHL_processed.csv"
+OUTPUT_ZIP_NAME = "940IHL_processed.zip"  # Per-file outputs of a batch
+CSV_CHUNK_SIZE = 5000  # Rows of an incoming 940 processed at a time
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))  # Background upload jobs per server process
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", 4))  # Files of a 940 batch merged at the same time
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", 200))  # Files a batch zip may unpack to
+BATCH_MAX_FILE_BYTES = int(os.environ.get("BATCH_MAX_FILE_BYTES", 64 * 1024 * 1024))  # Uncompressed size per zip member
+BATCH_MAX_TOTAL_BYTES = int(os.environ.get("BATCH_MAX_TOTAL_BYTES", 256 * 1024 * 1024))  # Uncompressed size of all zip members
+
+# Master UOM
+MASTER_UOM_KEEP_VERSIONS = int(os.environ.get("MASTER_UOM_KEEP_VERSIONS", 5))  # Published versions kept for rollback
+
+# Session Cleanup
+SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", 24 * 60 * 60))  # Remove sessions after 24 hours
+JANITOR_INTERVAL_SECONDS = int(os.environ.get("JANITOR_INTERVAL_SECONDS", 10 * 60))  # Check every 10 minutes
+
+# Result Cache
+# Bytes of finished results kept for identical re-uploads, least recently used evicted first
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# PDF Extraction
+# Worker processes used to extract BOL page text (1 = extract in-process)
+PDF_EXTRACT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+PDF_PAGES_PER_TASK = 10  # Pages each worker extracts per task
+PDF_IMAGE_DPI = 200  # Resolution pages are rendered to images at
+PDF_IMAGE_FORMAT = "jpeg"  # Image format of rendered pages ("jpeg", "png", ...)
+PDF_PAGES_PER_WINDOW = 10  # Consecutive pages rendered by one poppler call
 
 # Models
 OPENAI_MODEL = "o3-mini"
@@ -1,74 +1,110 @@
 import os
-import gc
 import glob
-import pandas as pd
+import uuid
 from config import OUTPUT_CSV_NAME
+from metrics import timed_stage
+
+# Bytes copied per read when joining the per-invoice CSV files
+COPY_BUFFER_SIZE = 1024 * 1024
 
 class CSVExporter:
-    def __init__(self, session_dir):
-        """Initialize the CSV exporter with a session directory."""
+    def __init__(self, session_dir, metrics=None):
+        """Initialize the CSV exporter with a session directory.
+
+        Args:
+            session_dir: Directory holding the per-invoice CSV files
+            metrics: Optional PipelineMetrics the export stage is timed in
+        """
         self.session_dir = session_dir
+        self.metrics = metrics
 
     def combine_to_csv(self):
-        """Combine all CSV files in the session directory into one."""
-        try:
-            # Get all CSV files in the session directory except the output file
-            csv_files = [f for f in glob.glob(os.path.join(self.session_dir, "*.csv"))
-                        if os.path.basename(f) != OUTPUT_CSV_NAME]
-
-            if not csv_files:
-                print("No CSV files found to combine")
+        """Combine all CSV files in the session directory into one.
+
+        The per-invoice files all share DataProcessor's 28-column header, so
+        they're joined by copying their data rows byte for byte after a single
+        header, in invoice order. Files whose header differs from the first
+        file's are skipped and left in place. Memory use doesn't grow with
+        the number or size of the files.
+        """
+        with timed_stage(self.metrics, "export") as stage:
+            try:
+                # Get all CSV files in the session directory except the output file, in invoice order
+                csv_files = sorted(f for f in glob.glob(os.path.join(self.session_dir, "*.csv"))
+                                   if os.path.basename(f) != OUTPUT_CSV_NAME)
+
+                if not csv_files:
+                    print("No CSV files found to combine")
+                    return False
+
+                print(f"Found {len(csv_files)} CSV files to combine")
+
+                output_path = os.path.join(self.session_dir, OUTPUT_CSV_NAME)
+                temp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+                header = None
+                combined_files = []
+                try:
+                    with open(temp_path, 'wb') as output_file:
+                        for file in csv_files:
+                            try:
+                                file_header = self._append_file(file, output_file, header, stage)
+                            except ValueError as e:
+                                print(f"Error processing {file}: {str(e)}")
+                                continue
+                            header = header or file_header
+                            combined_files.append(file)
+                    os.replace(temp_path, output_path)
+                finally:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+
+                # Delete the individual CSV files once the combined file is in place
+                for file in combined_files:
+                    os.remove(file)
+
+                stage.add(bytes_written=os.path.getsize(output_path))
+                print(f"Successfully combined {len(combined_files)} files into {OUTPUT_CSV_NAME}")
+                return True
+
+            except Exception as e:
+                print(f"Error combining CSV files: {str(e)}")
                 return False
 
-            print(f"Found {len(csv_files)} CSV files to combine")
-
-            # Process files in chunks to conserve memory
-            chunk_size = 5
-            output_path = os.path.join(self.session_dir, OUTPUT_CSV_NAME)
-            first_file = True
-
-            for i in range(0, len(csv_files), chunk_size):
-                chunk = csv_files[i:i + chunk_size]
-                print(f"Processing chunk {i//chunk_size + 1} of {(len(csv_files) + chunk_size - 1)//chunk_size}")
-                
-                # Read and combine chunk of CSV files
-                dfs = []
-                for file in chunk:
-                    try:
-                        # Read CSV in chunks
-                        for df_chunk in pd.read_csv(file, chunksize=1000, dtype=str):
-                            dfs.append(df_chunk)
-                        # Delete the individual CSV file after reading
-                        os.remove(file)
-                    except Exception as e:
-                        print(f"Error processing {file}: {str(e)}")
-                        continue
-
-                if not dfs:
-                    continue
-
-                # Combine chunks and write to output
-                chunk_df = pd.concat(dfs, ignore_index=True)
-                
-                if first_file:
-                    # Write with header for first chunk
-                    chunk_df.to_csv(output_path, index=False, mode='w')
-                    first_file = False
-                else:
-                    # Append without header for subsequent chunks
-                    chunk_df.to_csv(output_path, index=False, mode='a', header=False)
-
-                # Clear memory
-                del dfs
-                del chunk_df
-                gc.collect()
-
-            print(f"Successfully combined files into {OUTPUT_CSV_NAME}")
-            return True
-
-        except Exception as e:
-            print(f"Error combining CSV files: {str(e)}")
-            return False
+    def _append_file(self, file, output_file, header, stage):
+        """Copy one CSV file to output_file, dropping its header unless it's the first file.
+
+        Returns:
+            The file's header line
+
+        Raises:
+            ValueError: If the file is empty or its header differs from header.
+        """
+        with open(file, 'rb') as input_file:
+            file_header = input_file.readline()
+            if not file_header:
+                raise ValueError("file is empty")
+            if header is None:
+                output_file.write(file_header)
+                last_byte = file_header[-1:]
+            elif file_header.rstrip(b"\r\n") != header.rstrip(b"\r\n"):
+                raise ValueError("header doesn't match the other invoice files")
+            else:
+                last_byte = b"\n"
+
+            stage.add(bytes_read=len(file_header))
+            while True:
+                data = input_file.read(COPY_BUFFER_SIZE)
+                if not data:
+                    break
+                output_file.write(data)
+                stage.add(rows=data.count(b"\n"), bytes_read=len(data))
+                last_byte = data[-1:]
+
+            # Keep the next file's first row on a line of its own
+            if last_byte != b"\n":
+                output_file.write(os.linesep.encode())
+                stage.add(rows=1)
+        return file_header
 
 if __name__ == "__main__":
     exporter = CSVExporter(".")
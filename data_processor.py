@@ -6,15 +6,95 @@ import uuid
 import shutil
 from datetime import datetime
 from utils import FileUtils  # Removed OpenAI dependency
-import gc
+from collections import namedtuple
+from metrics import timed_stage, timed_iter
+
+# Precompiled patterns for BOL page scanning
+INVOICE_NO_RE = re.compile(r'BILL OF LADING\s+([A-Z]\d+)', re.IGNORECASE)
+BOL_CUBE_RE = re.compile(r'\b\d{1,3}\.\d{2}\b')
+
+# Everything extracted from one BOL page
+PageRecord = namedtuple('PageRecord', ['invoice_no', 'has_table', 'rows', 'has_totals', 'totals', 'bol_cube'])
+
+def scan_page(content):
+    """Extract invoice number, table rows, totals and BOL cube in one pass.
+
+    Produces the same results as _get_invoice_no, _extract_table_data and
+    _extract_bol_cube, but splits and upper-cases the page only once.
+    """
+    lines = content.splitlines()
+    upper_lines = content.upper().splitlines()
+    invoice_no = ""
+    table_state = 0  # 0 = before header, 1 = in table, 2 = after table
+    rows = []
+    has_totals = False
+    totals = {'pieces': '', 'weight': ''}
+    bol_cube = ""
+    cube_done = False
+
+    # Invoice number comes from the first 10 lines
+    for i in range(min(10, len(lines))):
+        if "BILL OF LADING" in upper_lines[i]:
+            match = INVOICE_NO_RE.search(lines[i])
+            if match:
+                invoice_no = match.group(1)
+                break
+
+    for i, upper in enumerate(upper_lines):
+        # BOL cube is the last cube-like number above the first SHIPPING INSTRUCTIONS
+        is_instructions = "SHIPPING INSTRUCTIONS:" in upper
+        if is_instructions and not cube_done:
+            cube_done = True
+            for j in range(i - 1, -1, -1):
+                match = BOL_CUBE_RE.search(lines[j])
+                if match:
+                    bol_cube = match.group(0)
+                    break
+
+        if table_state == 1:
+            if "TOTAL CARTONS" in upper:
+                has_totals = True
+                tokens = lines[i].split()
+                if len(tokens) >= 11:
+                    totals['pieces'] = tokens[3].replace(',', '')
+                    totals['weight'] = tokens[-1].replace(',', '')
+                table_state = 2
+            elif is_instructions:
+                table_state = 2
+            else:
+                # Table rows start with a number and have at least 3 tokens
+                tokens = lines[i].split()
+                if len(tokens) >= 3 and tokens[0][0].isdecimal():
+                    rows.append([
+                        tokens[0].replace(',', ''),   # cartons
+                        tokens[2].replace(',', ''),   # individual pieces
+                        tokens[-1].replace(',', ''),  # individual weight
+                        tokens[1],                    # style
+                    ])
+        elif table_state == 0:
+            if "CARTONS" in upper and "STYLE" in upper and "PIECES" in upper:
+                table_state = 1
+        elif cube_done:
+            break
+
+    return PageRecord(invoice_no, table_state > 0, rows, has_totals, totals, bol_cube)
 
 class DataProcessor:
-    def __init__(self, session_id=None):
-        """Initialize the data processor with a session directory."""
+    def __init__(self, session_id=None, metrics=None):
+        """Initialize the data processor with a session directory.
+
+        Args:
+            session_id: Name of the session directory; generated if omitted
+            metrics: Optional PipelineMetrics the extract, parse and
+                assemble stages are timed in
+        """
         self.base_dir = FileUtils.get_script_dir()
+        self.metrics = metrics
         self.session_id = session_id or self._generate_session_id()
         self.session_dir = os.path.join(self.base_dir, 'processing_sessions', self.session_id)
         self.invoice_data = {}  # Store data for multi-page invoices
+        self._sink = None  # OutputSink of the current run, if any
+        self.pages_without_table = []  # 1-based positions of pages with no BOL table, e.g. to render for review
         self._setup_session_directory()
 
     def _generate_session_id(self):
@@ -40,54 +120,99 @@ class DataProcessor:
             except Exception as e:
                 print(f"Error cleaning up sessions: {str(e)}")
 
-    def process_all_files(self):
-        """Process all TXT files in the session directory."""
-        # Get all txt files except requirements.txt
+    def process_all_files(self, sink=None):
+        """Process all TXT files in the session directory (see process_pages for sink)."""
+        # Get all txt files except requirements.txt, in page order
         txt_files = [f for f in FileUtils.get_txt_files(self.session_dir) if f != 'requirements.txt']
         if not txt_files:
             print("No TXT files found in the session directory")
             return False
 
+        txt_files.sort(key=self._page_sort_key)
         print(f"Found {len(txt_files)} TXT files to process")
-        
+        return self.process_pages(self._iter_txt_files(txt_files), sink)
+
+    def process_pages(self, pages, sink=None):
+        """Process page text handed over in memory.
+
+        Pages are assembled into invoices in a single pass. An invoice is
+        written out as soon as its "TOTAL CARTONS" page is seen, so only
+        invoices that are still open are kept in memory. Afterwards the
+        numbers of pages with no table are in pages_without_table, e.g. to
+        render just those with PDFProcessor.extract_images.
+
+        Args:
+            pages: Iterable of (page_label, text) tuples in page order, e.g.
+                straight from pdf_processor.iter_page_texts, so parsing
+                overlaps extraction.
+            sink: Optional OutputSink each invoice's rows are appended to
+                as it's assembled, in packet order, instead of writing one
+                CSV file per invoice for CSVExporter to combine.
+        """
+        self._sink = sink
+        self.pages_without_table = []
         try:
-            # Process files in smaller batches to conserve memory
-            batch_size = 10
-            for i in range(0, len(txt_files), batch_size):
-                batch = txt_files[i:i + batch_size]
-                print(f"Processing batch {i//batch_size + 1} of {(len(txt_files) + batch_size - 1)//batch_size}")
-                
-                # First pass: Collect data for this batch
-                for txt_file in batch:
-                    self._collect_invoice_data(txt_file)
-                
-                # Second pass: Process collected data for this batch
-                for invoice_no, pages_data in self.invoice_data.items():
-                    self._process_invoice_data(invoice_no, pages_data)
-                
-                # Clear processed data from memory
-                self.invoice_data.clear()
-                gc.collect()
+            # Pages are extracted lazily, so pulling the next one is the extract stage
+            for page_number, (page_label, content) in enumerate(timed_iter(self.metrics, "extract", pages), start=1):
+                with timed_stage(self.metrics, "parse"):
+                    invoice_no = self._collect_invoice_data(page_label, content, page_number)
+                if invoice_no and self.invoice_data[invoice_no]['has_totals']:
+                    self._process_invoice_data(invoice_no, self.invoice_data.pop(invoice_no))
+
+            # Invoices whose totals page never arrived
+            for invoice_no, pages_data in self.invoice_data.items():
+                self._process_invoice_data(invoice_no, pages_data)
+            self.invoice_data.clear()
             
             return True
             
         except Exception as e:
             print(f"Error processing files: {str(e)}")
             return False
+        finally:
+            self._sink = None
 
-    def _collect_invoice_data(self, txt_file):
-        """Collect data from a single TXT file and group by invoice number."""
-        file_path = os.path.join(self.session_dir, txt_file)
-        print(f"Collecting data from {txt_file}...")
+    @staticmethod
+    def _page_sort_key(txt_file):
+        """Sort numbered page files (1.txt, 2.txt, ... 10.txt) numerically."""
+        stem = os.path.splitext(txt_file)[0]
+        return (0, int(stem), "") if stem.isdigit() else (1, 0, stem)
+
+    def _iter_txt_files(self, txt_files):
+        """Read TXT files from the session directory, deleting each once it is processed."""
+        for txt_file in txt_files:
+            file_path = os.path.join(self.session_dir, txt_file)
+            try:
+                with open(file_path, 'r', encoding='utf-8') as file:
+                    content = file.read()
+            except Exception as e:
+                print(f"Error reading {txt_file}: {str(e)}")
+                continue
+
+            yield txt_file, content
+
+            # Delete the processed txt file
+            os.remove(file_path)
+
+    def _collect_invoice_data(self, page_label, content, page_number=None):
+        """Collect data from a single page and group by invoice number.
+
+        Pages without an invoice number or table are noted in
+        pages_without_table under page_number.
+
+        Returns:
+            The page's invoice number, or None if it could not be read.
+        """
+        print(f"Collecting data from {page_label}...")
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-
-            invoice_no = self._get_invoice_no(content)
+            page = scan_page(content)
+            invoice_no = page.invoice_no
+            if not page.has_table or not invoice_no:
+                self.pages_without_table.append(page_number)
             if not invoice_no:
-                print(f"Invoice number not found in {txt_file}")
-                return
+                print(f"Invoice number not found in {page_label}")
+                return None
 
             # Initialize invoice data if not exists
             if invoice_no not in self.invoice_data:
@@ -96,28 +221,23 @@ class DataProcessor:
                     'has_totals': False
                 }
 
-            # Extract table rows and check for totals
-            table_data = self._extract_table_data(content)
-            if table_data:
-                rows, has_totals, totals = table_data
+            # Keep the table rows and totals, not the full content
+            if page.has_table:
                 page_data = {
-                    'rows': rows,  # Don't store full content, just extracted data
-                    'has_totals': has_totals,
-                    'totals': totals,
-                    'bol_cube': self._extract_bol_cube(content)
+                    'rows': page.rows,
+                    'has_totals': page.has_totals,
+                    'totals': page.totals,
+                    'bol_cube': page.bol_cube
                 }
                 self.invoice_data[invoice_no]['pages'].append(page_data)
-                if has_totals:
+                if page.has_totals:
                     self.invoice_data[invoice_no]['has_totals'] = True
 
-            # Delete the processed txt file
-            os.remove(file_path)
+            return invoice_no
             
         except Exception as e:
-            print(f"Error collecting data from {txt_file}: {str(e)}")
-        
-        # Force garbage collection
-        gc.collect()
+            print(f"Error collecting data from {page_label}: {str(e)}")
+            return None
 
     def _extract_table_data(self, content):
         """Extract table rows and totals from content."""
@@ -199,30 +319,45 @@ class DataProcessor:
             print(f"ERROR: No valid totals found in any page for invoice {invoice_no}")
             return
 
-        # Collect all rows from all pages
-        all_rows = []
-        for page in data['pages']:
-            for row in page['rows']:
-                # row is [cartons, individual_pieces, individual_weight, style]
-                all_rows.append([row[0], bol_cube, row[1], row[2], invoice_no, row[3]])
-
-        # Generate CSV
-        formatted_data = self._format_csv(all_rows, totals['pieces'], totals['weight'])
-        if formatted_data:
-            new_filename = f"{invoice_no}.csv"
-            new_file_path = os.path.join(self.session_dir, new_filename)
+        with timed_stage(self.metrics, "assemble") as stage:
+            # Collect all rows from all pages
+            all_rows = []
+            for page in data['pages']:
+                for row in page['rows']:
+                    # row is [cartons, individual_pieces, individual_weight, style]
+                    all_rows.append([row[0], bol_cube, row[1], row[2], invoice_no, row[3]])
+
+            if self._sink is not None:
+                self._sink.write_header(self._output_header())
+                self._sink.write_rows(self._format_rows(all_rows, totals['pieces'], totals['weight']))
+                stage.add(rows=len(all_rows))
+                print(f"Processed multi-page invoice {invoice_no}")
+                return
+
+            # Generate CSV
+            formatted_data = self._format_csv(all_rows, totals['pieces'], totals['weight'])
+            if formatted_data:
+                new_filename = f"{invoice_no}.csv"
+                new_file_path = os.path.join(self.session_dir, new_filename)
             
-            with open(new_file_path, 'w', encoding='utf-8', newline='') as file:
-                file.write(formatted_data)
+                with open(new_file_path, 'w', encoding='utf-8', newline='') as file:
+                    file.write(formatted_data)
+                stage.add(rows=len(all_rows), bytes_written=os.path.getsize(new_file_path))
             
-            print(f"Processed multi-page invoice {invoice_no}")
+                print(f"Processed multi-page invoice {invoice_no}")
 
     def _format_csv(self, rows, total_pieces, total_weight):
         """Format rows into CSV with proper column mapping."""
         output = io.StringIO()
-        writer = csv.writer(output)
+        # Same line endings as the combined file, which is copied together from these
+        writer = csv.writer(output, lineterminator=os.linesep)
+        writer.writerow(self._output_header())
+        writer.writerows(self._format_rows(rows, total_pieces, total_weight))
+        return output.getvalue()
 
-        # Write header
+    @staticmethod
+    def _output_header():
+        """Return the 28-column header of the BOL output."""
         header = [""] * 28
         header[0] = "RTS ID"
         header[1] = "RTS Status"
@@ -252,16 +387,19 @@ class DataProcessor:
         header[25] = "Style"                  # Column Z
         header[26] = "Release"                  # Column AA
         header[27] = "Assigned Trucking Co."                  # Column AB
-        writer.writerow(header)
+        return header
 
+    @staticmethod
+    def _format_rows(rows, total_pieces, total_weight):
+        """Map an invoice's table rows to 28-column output rows, with the totals on the first."""
         # Sort rows by Invoice No. to ensure consistent grouping
         sorted_rows = sorted(rows, key=lambda x: x[4])  # Sort by Invoice No. (index 4)
         
         # Group rows by invoice number
+        data_rows = []
         current_invoice = None
         is_first_row = True
 
-        # Write data rows
         for row_data in sorted_rows:
             data_row = [""] * 28
             invoice_no = row_data[4]  # Get current row's invoice number
@@ -285,9 +423,9 @@ class DataProcessor:
                 data_row[23] = total_weight  # Total Weight
                 is_first_row = False
             
-            writer.writerow(data_row)
+            data_rows.append(data_row)
 
-        return output.getvalue()
+        return data_rows
 
     def _get_invoice_no(self, content):
         """Extract invoice number from content using regex."""
@@ -0,0 +1,128 @@
+from collections import defaultdict
+import numpy as np
+
+
+class ItemMatcher:
+    """Index over normalized master item numbers for fast 940 item lookups.
+
+    Answers the same question as a linear scan over the master items:
+    an exact key match first, otherwise the first item (in master file
+    order) that either contains the lookup value or is contained in it.
+    """
+
+    NGRAM_SIZE = 3
+
+    def __init__(self, items):
+        """Build the index from normalized item keys in master file order."""
+        self.keys = []                # unique non-empty keys, in first-seen order
+        self.positions = {}           # key -> position of its first occurrence
+        self.short_substrings = {}    # substring shorter than NGRAM_SIZE -> first position
+        self.ngrams = defaultdict(list)  # ngram -> ascending positions of keys containing it
+        self.max_key_length = 0
+
+        for item in items:
+            if not item or item in self.positions:
+                continue
+            position = len(self.keys)
+            self.keys.append(item)
+            self.positions[item] = position
+            self.max_key_length = max(self.max_key_length, len(item))
+
+            seen_ngrams = set()
+            for start in range(len(item)):
+                for length in range(1, self.NGRAM_SIZE):
+                    substring = item[start:start + length]
+                    if len(substring) == length and substring not in self.short_substrings:
+                        self.short_substrings[substring] = position
+                ngram = item[start:start + self.NGRAM_SIZE]
+                if len(ngram) == self.NGRAM_SIZE and ngram not in seen_ngrams:
+                    seen_ngrams.add(ngram)
+                    self.ngrams[ngram].append(position)
+
+    def to_arrays(self):
+        """Return the index as flat NumPy arrays for saving in a snapshot."""
+        ngram_keys = list(self.ngrams)
+        offsets = np.zeros(len(ngram_keys) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(self.ngrams[ngram]) for ngram in ngram_keys])
+        postings = [position for ngram in ngram_keys for position in self.ngrams[ngram]]
+        return {
+            "keys": np.array(self.keys, dtype=str),
+            "short_substrings": np.array(list(self.short_substrings), dtype=str),
+            "short_positions": np.array(list(self.short_substrings.values()), dtype=np.int64),
+            "ngram_keys": np.array(ngram_keys, dtype=str),
+            "ngram_offsets": offsets,
+            "ngram_postings": np.array(postings, dtype=np.int64),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuild an index saved with to_arrays() without re-scanning the keys."""
+        matcher = cls([])
+        matcher.keys = arrays["keys"].tolist()
+        matcher.positions = {key: position for position, key in enumerate(matcher.keys)}
+        matcher.short_substrings = dict(zip(arrays["short_substrings"].tolist(),
+                                            arrays["short_positions"].tolist()))
+        offsets = arrays["ngram_offsets"].tolist()
+        postings = arrays["ngram_postings"].tolist()
+        matcher.ngrams = defaultdict(list, {
+            ngram: postings[offsets[i]:offsets[i + 1]]
+            for i, ngram in enumerate(arrays["ngram_keys"].tolist())
+        })
+        matcher.max_key_length = max(map(len, matcher.keys), default=0)
+        return matcher
+
+    def __len__(self):
+        return len(self.keys)
+
+    def match(self, item_normalized):
+        """Find the master key for a normalized item.
+
+        Returns:
+            Tuple of (matched key or None, match type) where match type is
+            "exact", "partial" or "none".
+        """
+        if item_normalized in self.positions:
+            return item_normalized, "exact"
+
+        if not self.keys:
+            return None, "none"
+
+        # An empty value is contained in every key, so the first key wins
+        if not item_normalized:
+            return self.keys[0], "partial"
+
+        best = min(self._contained_by(item_normalized), self._containing(item_normalized))
+        if best == len(self.keys):
+            return None, "none"
+        return self.keys[best], "partial"
+
+    def _contained_by(self, item_normalized):
+        """Earliest position of a key that is a substring of the item."""
+        best = len(self.keys)
+        size = len(item_normalized)
+        for start in range(size):
+            stop = min(size, start + self.max_key_length)
+            for end in range(start + 1, stop + 1):
+                position = self.positions.get(item_normalized[start:end])
+                if position is not None and position < best:
+                    best = position
+        return best
+
+    def _containing(self, item_normalized):
+        """Earliest position of a key that contains the item."""
+        if len(item_normalized) < self.NGRAM_SIZE:
+            return self.short_substrings.get(item_normalized, len(self.keys))
+
+        postings = []
+        for start in range(len(item_normalized) - self.NGRAM_SIZE + 1):
+            positions = self.ngrams.get(item_normalized[start:start + self.NGRAM_SIZE])
+            if positions is None:
+                return len(self.keys)
+            postings.append(positions)
+
+        # Walk the shortest posting list in order and verify candidates
+        postings.sort(key=len)
+        for position in postings[0]:
+            if item_normalized in self.keys[position]:
+                return position
+        return len(self.keys)
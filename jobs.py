@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import uuid
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from metrics import PipelineMetrics
+
+ORPHANED_JOB_MESSAGE = "The server process running this job stopped before it finished. Please upload the file again."
+
+def _process_started(pid):
+    """Return when process pid started (clock ticks since boot), or None if unknown.
+
+    Read from /proc where available, so a reused pid isn't mistaken for the
+    process that started a job.
+    """
+    try:
+        with open(f"/proc/{pid}/stat", 'r') as stat_file:
+            stat = stat_file.read()
+    except OSError:
+        return None
+    # The command name may contain spaces, so count fields after its closing parenthesis
+    return int(stat.rsplit(")", 1)[1].split()[19])
+
+def _process_alive(pid, started):
+    """Return whether the process that recorded (pid, started) is still running."""
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows; assume it's alive
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Exists, but belongs to another user
+    current = _process_started(pid)
+    return started is None or current is None or current == started
+
+class JobManager:
+    """Runs uploads in a local background pool and tracks their status.
+
+    Status is kept as one JSON file per job so any gunicorn worker can
+    answer /jobs/<id>, whichever worker is running the job. Each job
+    records the pid and start time of the process running it, so jobs left
+    queued or running by a worker that was restarted or killed are marked
+    failed instead of being polled forever.
+    """
+
+    def __init__(self, jobs_dir, max_workers=2, result_registry=None, metrics_store=None):
+        """Initialize the job manager.
+
+        Args:
+            jobs_dir: Directory the job status files are written to
+            max_workers: Number of jobs this process runs at the same time
+            result_registry: Optional ResultRegistry that issues download
+                tokens for the output of successful jobs
+            metrics_store: Optional MetricsStore every finished job's
+                stage metrics are added to
+        """
+        self.jobs_dir = jobs_dir
+        self.max_workers = max_workers
+        self.result_registry = result_registry
+        self.metrics_store = metrics_store
+        self._executor = None
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+    def _status_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _write_status(self, status):
+        """Write a job's status atomically so readers never see a partial file."""
+        status['updated_at'] = time.time()
+        path = self._status_path(status['id'])
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as status_file:
+            json.dump(status, status_file)
+        os.replace(temp_path, path)
+
+    def submit(self, kind, func, *args, result_path=None):
+        """Queue func(*args, progress=callback, metrics=metrics) and return the new job ID.
+
+        func must return a (success, message) tuple like the process_*
+        functions. progress is called with keyword counters that are
+        merged into the job's "counts". metrics is a PipelineMetrics named
+        after kind whose stage timings end up in the job's "metrics".
+
+        result_path is the file func writes the job's output to. It's served
+        for the job ID and its download token, so no other job may write it.
+        """
+        job_id = uuid.uuid4().hex
+        status = {
+            'id': job_id,
+            'kind': kind,
+            'status': 'queued',
+            'message': "",
+            'error': None,
+            'counts': {},
+            'result_path': result_path,
+            'created_at': time.time(),
+            'owner_pid': os.getpid(),
+            'owner_started': _process_started(os.getpid()),
+        }
+        self._write_status(status)
+
+        # Created lazily so the pool's threads start in the serving process
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        self._executor.submit(self._run, status, func, args)
+        print(f"Queued {kind} job {job_id}")
+        return job_id
+
+    def _run(self, status, func, args):
+        """Run a job and record its outcome."""
+        status['status'] = 'running'
+        self._write_status(status)
+
+        def progress(**counts):
+            status['counts'].update(counts)
+            self._write_status(status)
+
+        metrics = PipelineMetrics(status['kind'])
+        try:
+            success, message = func(*args, progress=progress, metrics=metrics)
+        except Exception as e:
+            traceback.print_exc()
+            success, message = False, str(e)
+
+        if success:
+            status['status'] = 'done'
+            status['message'] = message
+            if status['result_path'] and self.result_registry:
+                status['download_token'] = self.result_registry.register(status['result_path'])
+        else:
+            status['status'] = 'failed'
+            status['error'] = message
+        status['metrics'] = metrics.to_dict()
+        if self.metrics_store:
+            try:
+                self.metrics_store.record(metrics, status['status'])
+            except Exception as e:
+                print(f"Error recording metrics for job {status['id']}: {e}")
+        self._write_status(status)
+        print(f"Job {status['id']} {status['status']}: {message}")
+
+    def get(self, job_id):
+        """Return a job's status dict, or None if the job is unknown."""
+        # Job IDs are hex UUIDs; refuse anything else before touching the filesystem
+        if not job_id or not all(c in "0123456789abcdef" for c in job_id):
+            return None
+        try:
+            with open(self._status_path(job_id), 'r', encoding='utf-8') as status_file:
+                status = json.load(status_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        if (status['status'] in ('queued', 'running') and 'owner_pid' in status
+                and not _process_alive(status['owner_pid'], status.get('owner_started'))):
+            status['status'] = 'failed'
+            status['error'] = ORPHANED_JOB_MESSAGE
+            self._write_status(status)
+            print(f"Job {job_id} failed: its process {status['owner_pid']} is gone")
+        return status
+
+    def cleanup(self, max_age_seconds):
+        """Remove status files of jobs last updated more than max_age_seconds ago.
+
+        Newer jobs whose process is gone are marked failed.
+        """
+        cutoff = time.time() - max_age_seconds
+        for name in os.listdir(self.jobs_dir):
+            path = os.path.join(self.jobs_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                elif name.endswith(".json"):
+                    self.get(name[:-len(".json")])
+            except OSError as e:
+                print(f"Error cleaning up job {name}: {e}")
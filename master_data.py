@@ -0,0 +1,350 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import zipfile
+import threading
+import numpy as np
+import pandas as pd
+from column_matcher import header_resolver
+from item_matcher import ItemMatcher
+from table_reader import read_table, read_table_header
+from uom_calculator import build_item_table
+from config import MASTER_UOM_KEEP_VERSIONS
+
+# Path for the master UOM file
+MASTER_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "master_data")
+MASTER_UOM_FILE = os.path.join(MASTER_DATA_DIR, "master_uom.csv")
+MASTER_VERSIONS_DIR = os.path.join(MASTER_DATA_DIR, "versions")
+
+# Columns every UOM file must provide
+UOM_COLUMNS = ["Item #", "Weight", "Cube", "Length", "Width", "Height", "Sequence 10: QTY"]
+
+# Binary snapshot of a parsed master version, compiled into the versions directory
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_RAW_COLUMNS = ["weight", "cube", "length", "width", "height", "qty"]
+
+# Ensure master data directory exists
+if not os.path.exists(MASTER_DATA_DIR):
+    os.makedirs(MASTER_DATA_DIR)
+
+# Function to normalize item values for matching
+def normalize_item(item_value):
+    if not pd.isna(item_value):
+        # Convert to string and strip whitespace
+        item_str = str(item_value).strip()
+        # Remove any special characters or formatting that might differ
+        # Convert to uppercase for case-insensitive matching
+        item_str = item_str.upper()
+        # Replace common separators with empty string
+        for char in ['-', '.', ' ', '_']:
+            item_str = item_str.replace(char, '')
+        return item_str
+    return ""
+
+class MasterUOM:
+    """A parsed UOM table with its normalized item lookups."""
+
+    def __init__(self, df, source_path, version=None):
+        """Resolve the UOM columns and build the item lookup structures.
+
+        Args:
+            df: UOM table read with all columns as strings
+            source_path: File the table was read from
+            version: Content hash identifying the master store version, if any
+
+        Raises:
+            ValueError: If the table is missing any of the UOM columns.
+        """
+        self.source_path = source_path
+        self.version = version
+        self.column_mappings = {}
+        missing_columns = []
+
+        # Find the best matches for each required column
+        resolved = header_resolver.resolve(df.columns, UOM_COLUMNS)
+        for col in UOM_COLUMNS:
+            matched_col = resolved[col]
+            if matched_col is not None:
+                self.column_mappings[col] = matched_col
+                print(f"First CSV matched '{col}' to '{matched_col}'")
+            else:
+                missing_columns.append(col)
+                print(f"Could not match column in first CSV: {col}")
+
+        if missing_columns:
+            raise ValueError(f"Missing columns in UOM file: {', '.join(missing_columns)}")
+
+        normalized_items = df[self.column_mappings['Item #']].apply(normalize_item)
+        self.sample_items = df[self.column_mappings['Item #']].head(5).tolist()
+
+        # Map item data using normalized Item # as key (later rows win)
+        item_data = {}
+        columns = zip(
+            normalized_items,
+            df[self.column_mappings["Weight"]],
+            df[self.column_mappings["Cube"]],
+            df[self.column_mappings["Length"]],
+            df[self.column_mappings["Width"]],
+            df[self.column_mappings["Height"]],
+            df[self.column_mappings["Sequence 10: QTY"]],
+        )
+        for normalized_id, weight, cube, length, width, height, qty in columns:
+            if normalized_id:
+                item_data[normalized_id] = {
+                    "weight": weight,
+                    "cube": cube,
+                    "length": length,
+                    "width": width,
+                    "height": height,
+                    "qty": qty
+                }
+
+        # Parse the numeric columns once for the vectorized calculations
+        self.items = build_item_table(item_data)
+
+        # Index the master items once so partial matches don't scan every row.
+        # The table keeps each key's first position, so its order is file order.
+        self.matcher = ItemMatcher(self.items.index)
+        print(f"Loaded UOM table {source_path} with {len(self.items)} items")
+
+    @classmethod
+    def load(cls, file_path, version=None):
+        """Read and parse a UOM file from disk, reading only the UOM columns."""
+        header = read_table_header(file_path)
+        resolved = header_resolver.resolve(header.columns, UOM_COLUMNS)
+        columns = list(dict.fromkeys(column for column in resolved.values() if column is not None))
+        return cls(read_table(file_path, columns=columns), file_path, version)
+
+    def save_snapshot(self, snapshot_path):
+        """Write the parsed table and matcher index to a binary snapshot.
+
+        Args:
+            snapshot_path: .npz file to write; replaced atomically
+        """
+        meta = {
+            "format": SNAPSHOT_FORMAT,
+            "version": self.version,
+            "column_mappings": self.column_mappings,
+            "sample_items": ["" if pd.isna(item) else str(item) for item in self.sample_items],
+        }
+        arrays = {f"matcher_{name}": array for name, array in self.matcher.to_arrays().items()}
+        for column in SNAPSHOT_RAW_COLUMNS:
+            values = self.items[column]
+            arrays[column] = values.where(values.notna(), "").to_numpy(dtype=str)
+            arrays[f"{column}_value"] = self.items[f"{column}_value"].to_numpy(dtype=np.float64)
+        arrays["meta"] = np.array(json.dumps(meta))
+
+        temp_path = f"{snapshot_path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'wb') as snapshot_file:
+            np.savez(snapshot_file, **arrays)
+        os.replace(temp_path, snapshot_path)
+
+    @classmethod
+    def load_snapshot(cls, snapshot_path, version, source_path):
+        """Load a snapshot written by save_snapshot().
+
+        Returns:
+            The MasterUOM, or None if the snapshot is missing, unreadable or
+            was compiled from a different version of the UOM file.
+        """
+        try:
+            with np.load(snapshot_path, allow_pickle=False) as snapshot:
+                meta = json.loads(snapshot["meta"].item())
+                if meta.get("format") != SNAPSHOT_FORMAT or meta.get("version") != version:
+                    return None
+                arrays = {name: snapshot[name] for name in snapshot.files}
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Ignoring unreadable UOM snapshot {snapshot_path}: {e}")
+            return None
+
+        master = cls.__new__(cls)
+        master.source_path = source_path
+        master.version = version
+        master.column_mappings = meta["column_mappings"]
+        master.sample_items = meta["sample_items"]
+        master.matcher = ItemMatcher.from_arrays({
+            name[len("matcher_"):]: array for name, array in arrays.items() if name.startswith("matcher_")
+        })
+        items = {column: arrays[column].astype(object) for column in SNAPSHOT_RAW_COLUMNS}
+        items.update({f"{column}_value": arrays[f"{column}_value"] for column in SNAPSHOT_RAW_COLUMNS})
+        master.items = pd.DataFrame(items, index=pd.Index(master.matcher.keys, dtype=object))
+        print(f"Loaded UOM snapshot {snapshot_path} with {len(master.items)} items")
+        return master
+
+def file_signature(file_path):
+    """Return (mtime_ns, size) identifying the current version of a file."""
+    stat = os.stat(file_path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def stream_version(stream, length=16):
+    """Return the content hash of a binary stream, read to its end, as a version handle.
+
+    The SHA-256 hex digest is cut to length characters; None keeps all of it,
+    e.g. for cache keys of uploaded files.
+    """
+    digest = hashlib.sha256()
+    for block in iter(lambda: stream.read(1024 * 1024), b""):
+        digest.update(block)
+    return digest.hexdigest()[:length]
+
+def file_version(file_path, length=16):
+    """Return the content hash of a file (see stream_version), e.g. a master UOM version handle."""
+    with open(file_path, 'rb') as source:
+        return stream_version(source, length)
+
+class MasterUOMStore:
+    """Versioned master UOM file with atomic publishing.
+
+    The current table is always a complete CSV at file_path: uploads are
+    validated into a temp file and published with os.replace, so readers
+    never see a partial file. Each published version is archived in
+    versions_dir under its content hash together with its binary snapshot,
+    and only the newest keep_versions are kept.
+    """
+
+    def __init__(self, file_path, versions_dir, keep_versions=5):
+        self.file_path = file_path
+        self.versions_dir = versions_dir
+        self.keep_versions = keep_versions
+        os.makedirs(self.versions_dir, exist_ok=True)
+
+    def _version_path(self, version, suffix):
+        name = os.path.splitext(os.path.basename(self.file_path))[0]
+        return os.path.join(self.versions_dir, f"{name}.{version}{suffix}")
+
+    def load(self):
+        """Load the current version, from its snapshot when one was compiled.
+
+        The hash and the table come from the same open file, so a version
+        published in between (os.replace swaps the path, not the open file)
+        can't be labelled with this one's hash.
+        """
+        with open(self.file_path, 'rb') as uom_file:
+            version = stream_version(uom_file)
+            snapshot_path = self._version_path(version, ".snapshot.npz")
+            master = MasterUOM.load_snapshot(snapshot_path, version, self.file_path)
+            if master is not None:
+                return master
+
+            # Parse a private copy of the bytes that were hashed
+            uom_file.seek(0)
+            temp_path = os.path.join(os.path.dirname(self.file_path), f".{uuid.uuid4().hex}.csv")
+            try:
+                with open(temp_path, 'wb') as temp_file:
+                    shutil.copyfileobj(uom_file, temp_file)
+                master = MasterUOM.load(temp_path, version)
+            finally:
+                os.remove(temp_path)
+
+        master.source_path = self.file_path
+        master.save_snapshot(snapshot_path)
+        return master
+
+    def publish(self, upload_path):
+        """Validate an uploaded UOM file and make it the current version.
+
+        CSV uploads are published byte for byte; Excel uploads are converted
+        to CSV first.
+
+        Returns:
+            The parsed MasterUOM of the new version.
+
+        Raises:
+            ValueError: If the file type is unsupported or UOM columns are missing.
+        """
+        temp_path = os.path.join(os.path.dirname(self.file_path), f".{uuid.uuid4().hex}.csv")
+        try:
+            if os.path.splitext(upload_path)[1].lower() == ".csv":
+                shutil.copyfile(upload_path, temp_path)
+            else:
+                read_table(upload_path).to_csv(temp_path, index=False)
+
+            # Parsing validates the columns; then archive the version and
+            # compile its snapshot before it goes live
+            version = file_version(temp_path)
+            master = MasterUOM.load(temp_path, version)
+            master.source_path = self.file_path
+            master.save_snapshot(self._version_path(version, ".snapshot.npz"))
+            shutil.copyfile(temp_path, self._version_path(version, ".csv"))
+
+            os.replace(temp_path, self.file_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        print(f"Published master UOM version {version}")
+        self.prune()
+        return master
+
+    def versions(self):
+        """Return archived version hashes, newest first."""
+        name = os.path.splitext(os.path.basename(self.file_path))[0]
+        archived = []
+        for file_name in os.listdir(self.versions_dir):
+            parts = file_name.split(".")
+            if len(parts) == 3 and parts[0] == name and parts[2] == "csv":
+                path = os.path.join(self.versions_dir, file_name)
+                archived.append((os.path.getmtime(path), parts[1]))
+        return [version for _, version in sorted(archived, reverse=True)]
+
+    def version_path(self, version):
+        """Return the archived CSV of a version, or None if it isn't kept."""
+        if version not in self.versions():
+            return None
+        return self._version_path(version, ".csv")
+
+    def prune(self):
+        """Remove archived versions beyond keep_versions, never the current one."""
+        current = file_version(self.file_path) if os.path.exists(self.file_path) else None
+        for version in self.versions()[self.keep_versions:]:
+            if version == current:
+                continue
+            for suffix in (".csv", ".snapshot.npz"):
+                try:
+                    os.remove(self._version_path(version, suffix))
+                except FileNotFoundError:
+                    pass
+            print(f"Removed old master UOM version {version}")
+
+class MasterUOMCache:
+    """Process-wide cache of the parsed current master UOM version.
+
+    The table is reloaded only when the published file's mtime or size
+    changes, or after an explicit invalidate(). Callers keep the MasterUOM
+    they got for the life of a job, so a new version being published
+    doesn't change the table under them.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._signature = None
+        self._master = None
+
+    def get(self):
+        """Return the parsed master table, reloading it if a new version was published."""
+        signature = file_signature(self.store.file_path)
+        master = self._master
+        if master is not None and signature == self._signature:
+            return master
+
+        with self._lock:
+            # Another thread may have reloaded while we waited
+            signature = file_signature(self.store.file_path)
+            if self._master is None or signature != self._signature:
+                print(f"Loading master UOM file: {self.store.file_path}")
+                self._master = self.store.load()
+                self._signature = signature
+            return self._master
+
+    def invalidate(self):
+        """Drop the cached table so the next get() re-reads the file."""
+        with self._lock:
+            self._master = None
+            self._signature = None
+
+master_uom_store = MasterUOMStore(MASTER_UOM_FILE, MASTER_VERSIONS_DIR, MASTER_UOM_KEEP_VERSIONS)
+master_uom_cache = MasterUOMCache(master_uom_store)
@@ -0,0 +1,197 @@
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from session_store import connect
+
+# Counters kept for every stage, in the order they're reported
+STAGE_FIELDS = ["seconds", "calls", "rows", "bytes_read", "bytes_written"]
+
+class StageMetrics:
+    """Wall time and counters accumulated by one pipeline stage."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.rows = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def add(self, rows=0, bytes_read=0, bytes_written=0):
+        """Count rows processed and bytes read or written by the stage."""
+        self.rows += rows
+        self.bytes_read += bytes_read
+        self.bytes_written += bytes_written
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in STAGE_FIELDS}
+
+class PipelineMetrics:
+    """Per-stage timings and counters for one run of a pipeline.
+
+    Stages are named by the caller (e.g. "file_read", "item_match") and
+    accumulate over repeated entries, so a stage run once per chunk reports
+    its total time and call count.
+    """
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.stages = {}
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _stage(self, name):
+        with self._lock:
+            return self.stages.setdefault(name, StageMetrics())
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block as one call of the named stage; yields the stage's counters."""
+        stage = self._stage(name)
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stage.seconds += elapsed
+                stage.calls += 1
+
+    def merge(self, other):
+        """Add another run's stages to this one, e.g. the files of a batch.
+
+        Stages of runs that overlapped in time (parallel batch files) add
+        up to more than the wall time of the whole run.
+        """
+        for name, other_stage in other.stages.items():
+            stage = self._stage(name)
+            with self._lock:
+                for field in STAGE_FIELDS:
+                    setattr(stage, field, getattr(stage, field) + getattr(other_stage, field))
+
+    def to_dict(self):
+        """Return the metrics as a JSON-serializable dict."""
+        with self._lock:
+            return {
+                "pipeline": self.pipeline,
+                "started_at": self.started_at,
+                "total_seconds": time.perf_counter() - self._start,
+                "stages": {name: stage.to_dict() for name, stage in self.stages.items()},
+            }
+
+def timed_stage(metrics, name):
+    """Return metrics.stage(name), or a context that records nothing if metrics is None."""
+    if metrics is None:
+        return nullcontext(StageMetrics())
+    return metrics.stage(name)
+
+def timed_iter(metrics, name, iterable):
+    """Yield from iterable, timing each step as the named stage and counting rows.
+
+    Items with a length (DataFrame chunks) count that many rows, others one.
+    """
+    iterator = iter(iterable)
+    while True:
+        with timed_stage(metrics, name) as stage:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            stage.add(rows=len(item) if hasattr(item, '__len__') else 1)
+        yield item
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+class MetricsStore:
+    """SQLite totals of pipeline runs and stage metrics, shared by all server processes.
+
+    Each finished run adds its stage counters to the totals, which /metrics
+    reports in the Prometheus text format.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with connect(self.db_path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pipeline_runs ("
+                " pipeline TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " runs INTEGER NOT NULL,"
+                " seconds REAL NOT NULL,"
+                " PRIMARY KEY (pipeline, status))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pipeline_stages ("
+                " pipeline TEXT NOT NULL,"
+                " stage TEXT NOT NULL,"
+                " seconds REAL NOT NULL,"
+                " calls INTEGER NOT NULL,"
+                " rows INTEGER NOT NULL,"
+                " bytes_read INTEGER NOT NULL,"
+                " bytes_written INTEGER NOT NULL,"
+                " PRIMARY KEY (pipeline, stage))"
+            )
+
+    def record(self, metrics, status):
+        """Add a finished run's metrics to the totals.
+
+        Args:
+            metrics: PipelineMetrics of the run
+            status: Outcome of the run, e.g. "done" or "failed"
+        """
+        summary = metrics.to_dict()
+        with connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO pipeline_runs (pipeline, status, runs, seconds) VALUES (?, ?, 1, ?)"
+                " ON CONFLICT (pipeline, status) DO UPDATE SET"
+                " runs = runs + 1, seconds = seconds + excluded.seconds",
+                (metrics.pipeline, status, summary["total_seconds"])
+            )
+            conn.executemany(
+                "INSERT INTO pipeline_stages (pipeline, stage, seconds, calls, rows, bytes_read, bytes_written)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (pipeline, stage) DO UPDATE SET"
+                " seconds = seconds + excluded.seconds, calls = calls + excluded.calls,"
+                " rows = rows + excluded.rows, bytes_read = bytes_read + excluded.bytes_read,"
+                " bytes_written = bytes_written + excluded.bytes_written",
+                [(metrics.pipeline, name, *(stage[field] for field in STAGE_FIELDS))
+                 for name, stage in summary["stages"].items()]
+            )
+
+    def render_prometheus(self):
+        """Return the totals in the Prometheus text exposition format."""
+        with connect(self.db_path) as conn:
+            runs = conn.execute(
+                "SELECT pipeline, status, runs, seconds FROM pipeline_runs ORDER BY pipeline, status"
+            ).fetchall()
+            stages = conn.execute(
+                "SELECT pipeline, stage, seconds, calls, rows, bytes_read, bytes_written"
+                " FROM pipeline_stages ORDER BY pipeline, stage"
+            ).fetchall()
+
+        lines = []
+
+        def family(name, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{_escape_label(val)}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        family("pipeline_runs_total", "Finished pipeline runs.",
+               [({"pipeline": p, "status": s}, n) for p, s, n, _ in runs])
+        family("pipeline_run_seconds_total", "Wall time of finished pipeline runs.",
+               [({"pipeline": p, "status": s}, seconds) for p, s, _, seconds in runs])
+
+        stage_families = [
+            ("pipeline_stage_seconds_total", "Wall time spent in a pipeline stage."),
+            ("pipeline_stage_calls_total", "Times a pipeline stage ran."),
+            ("pipeline_stage_rows_total", "Rows processed by a pipeline stage."),
+            ("pipeline_stage_bytes_read_total", "Bytes read by a pipeline stage."),
+            ("pipeline_stage_bytes_written_total", "Bytes written by a pipeline stage."),
+        ]
+        for index, (name, help_text) in enumerate(stage_families):
+            family(name, help_text, [({"pipeline": row[0], "stage": row[1]}, row[2 + index]) for row in stages])
+
+        return "\n".join(lines) + "\n"
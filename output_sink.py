@@ -0,0 +1,121 @@
+import io
+import os
+import csv
+import uuid
+from openpyxl import Workbook
+
+class OutputSink:
+    """Destination for assembled output rows: a header once, then rows as they're ready.
+
+    Sinks are context managers; leaving the block closes the sink, or aborts
+    it if an exception was raised, so a failed run leaves no partial file.
+    """
+
+    def __init__(self):
+        self.rows_written = 0
+        self._header_written = False
+        self._closed = False
+
+    def write_header(self, header):
+        """Write the header row; later calls are ignored."""
+        if not self._header_written:
+            self._write_row(header)
+            self._header_written = True
+
+    def write_rows(self, rows):
+        """Append data rows (lists of cell values)."""
+        for row in rows:
+            self._write_row(row)
+            self.rows_written += 1
+
+    def _write_row(self, row):
+        raise NotImplementedError
+
+    def close(self):
+        """Finish the output; does nothing if already closed or aborted."""
+        if not self._closed:
+            self._closed = True
+            self._finish()
+
+    def abort(self):
+        """Discard the output; does nothing if already closed or aborted."""
+        if not self._closed:
+            self._closed = True
+            self._discard()
+
+    def _finish(self):
+        pass
+
+    def _discard(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+class CSVSink(OutputSink):
+    """Writes rows to a CSV file, built in a temporary file and moved into place on close."""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        self._file = open(self._temp_path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file, lineterminator=os.linesep)
+
+    def _write_row(self, row):
+        self._writer.writerow(row)
+
+    def write_rows(self, rows):
+        rows = list(rows)
+        self._writer.writerows(rows)
+        self.rows_written += len(rows)
+
+    def _finish(self):
+        self._file.close()
+        os.replace(self._temp_path, self.path)
+
+    def _discard(self):
+        self._file.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+class XLSXSink(OutputSink):
+    """Writes rows to an XLSX workbook, streamed to disk by openpyxl's write-only mode."""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet()
+
+    def _write_row(self, row):
+        self._sheet.append(row)
+
+    def _finish(self):
+        temp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        self._workbook.save(temp_path)
+        os.replace(temp_path, self.path)
+
+    def _discard(self):
+        self._workbook.close()
+
+class MemorySink(OutputSink):
+    """Keeps the output as CSV text in memory, e.g. to send in an HTTP response."""
+
+    def __init__(self):
+        super().__init__()
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator=os.linesep)
+
+    def _write_row(self, row):
+        self._writer.writerow(row)
+
+    def getvalue(self):
+        """Return the CSV text written so far."""
+        return self._buffer.getvalue()
@@ -1,15 +1,223 @@
 import os
 import gc
+import json
+import uuid
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import pdfplumber
 import pdf2image
+from pdfminer.pdftypes import PDFObjRef, PDFStream
+from pdfminer.psparser import PSLiteral
 from utils import PopplerUtils, FileUtils
-from config import POPPLER_PATH
+from metrics import timed_stage
+from result_cache import result_cache, cache_key
+from master_data import file_version
+from config import (POPPLER_PATH, PDF_EXTRACT_WORKERS, PDF_PAGES_PER_TASK, PDF_IMAGE_DPI, PDF_IMAGE_FORMAT,
+                    PDF_PAGES_PER_WINDOW)
+
+# Page attributes the extracted text depends on (inherited ones are filled in by pdfminer)
+PAGE_TEXT_ATTRS = ["Contents", "Resources", "MediaBox", "CropBox", "Rotate"]
+
+def _extract_pages(pdf_path, indexes):
+    """Extract text from the pages at the given 0-based indexes of a PDF.
+
+    Runs in a worker process, so the PDF is opened independently here.
+    """
+    texts = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for index in indexes:
+            page = pdf.pages[index]
+            texts.append(page.extract_text())
+            page.flush_cache()
+    return texts
+
+def _update_digest(digest, obj, memo):
+    """Feed a PDF object, with everything it references, into a hash.
+
+    Referenced objects are hashed once per document and memoized by object
+    ID, so fonts shared by every page are only read once; a reference back
+    into an object still being hashed counts as empty.
+    """
+    if isinstance(obj, PDFObjRef):
+        if obj.objid not in memo:
+            memo[obj.objid] = b""
+            referenced = hashlib.sha256()
+            _update_digest(referenced, obj.resolve(), memo)
+            memo[obj.objid] = referenced.digest()
+        digest.update(b"R" + memo[obj.objid])
+    elif isinstance(obj, PDFStream):
+        digest.update(b"S")
+        _update_digest(digest, obj.attrs, memo)
+        data = obj.get_data()
+        digest.update(len(data).to_bytes(8, "big") + data)
+    elif isinstance(obj, dict):
+        digest.update(b"D%d" % len(obj))
+        for key in sorted(obj, key=str):
+            if key == "Parent":
+                continue  # Leads to the page tree, i.e. every other page
+            digest.update(repr(key).encode("utf-8"))
+            _update_digest(digest, obj[key], memo)
+    elif isinstance(obj, (list, tuple)):
+        digest.update(b"L%d" % len(obj))
+        for item in obj:
+            _update_digest(digest, item, memo)
+    elif isinstance(obj, PSLiteral):
+        digest.update(b"N" + repr(obj.name).encode("utf-8"))
+    else:
+        digest.update(repr(obj).encode("utf-8"))
+
+def page_cache_key(page, memo):
+    """Return the extraction cache key of a pdfplumber page.
+
+    The key hashes what the page's text is extracted from: its content
+    streams and resources (fonts, form XObjects) and its boxes and rotation,
+    so the same page in another PDF has the same key.
+    """
+    page_obj = page.page_obj
+    digest = hashlib.sha256()
+    for name in PAGE_TEXT_ATTRS:
+        digest.update(name.encode("utf-8"))
+        _update_digest(digest, page_obj.attrs.get(name), memo)
+    return cache_key("page-text", pdfplumber.__version__, digest.hexdigest())
+
+def _lookup_pages(pdf, cache, metrics):
+    """Return (cache keys, {index: cached text}) for the pages of an open PDF."""
+    keys = [None] * len(pdf.pages)
+    cached = {}
+    if cache is None:
+        return keys, cached
+
+    with timed_stage(metrics, "page_cache_lookup"):
+        memo = {}
+        for index, page in enumerate(pdf.pages):
+            keys[index] = page_cache_key(page, memo)
+            entry = cache.get(keys[index])
+            if entry is not None:
+                cached[index] = json.loads(entry[0])
+
+    # The hit rate is page_cache_hit rows / (page_cache_hit + page_cache_miss rows)
+    with timed_stage(metrics, "page_cache_hit") as stage:
+        stage.add(rows=len(cached))
+    with timed_stage(metrics, "page_cache_miss") as stage:
+        stage.add(rows=len(keys) - len(cached))
+    if keys:
+        print(f"Page cache: {len(cached)} of {len(keys)} pages cached ({len(cached) / len(keys):.0%} hit rate)")
+    return keys, cached
+
+def _store_pages(cache, keys, texts):
+    """Cache extracted page texts, given as {index: text}."""
+    if cache is not None:
+        cache.put_many((keys[index], json.dumps(text).encode("utf-8"), None) for index, text in texts.items())
+
+def iter_page_texts(pdf_path, workers=PDF_EXTRACT_WORKERS, pages_per_task=PDF_PAGES_PER_TASK,
+                    cache=None, metrics=None):
+    """Yield (page_number, text) for every page of a PDF in page order.
+
+    With more than one worker the pages to extract are split into tasks of
+    pages_per_task pages that are extracted in a process pool; results
+    are still yielded in page order.
+
+    With a cache (a DiskLRUCache), each page's text is kept under
+    page_cache_key, so pages already extracted from any earlier PDF, like
+    the unchanged pages of a re-sent packet, aren't extracted again. Hits
+    and misses are counted as the rows of the page_cache_hit and
+    page_cache_miss stages of metrics.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+        keys, cached = _lookup_pages(pdf, cache, metrics)
+        missing = [index for index in range(page_count) if index not in cached]
+
+        if workers <= 1 or len(missing) <= pages_per_task:
+            extracted = {}
+            try:
+                for i, page in enumerate(pdf.pages):
+                    if i in cached:
+                        yield i + 1, cached[i]
+                        continue
+
+                    # Process one page at a time
+                    text = extracted[i] = page.extract_text()
+                    yield i + 1, text
+
+                    # Clear page from memory
+                    page.flush_cache()
+
+                    # Force garbage collection every few pages
+                    if i % 5 == 0:
+                        gc.collect()
+            finally:
+                # Stored together, as one cache transaction
+                _store_pages(cache, keys, extracted)
+            return
+
+    tasks = [missing[start:start + pages_per_task] for start in range(0, len(missing), pages_per_task)]
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        results = zip(tasks, executor.map(_extract_pages, [pdf_path] * len(tasks), tasks))
+        extracted = {}
+        for i in range(page_count):
+            if i in cached:
+                yield i + 1, cached[i]
+                continue
+            while i not in extracted:
+                indexes, texts = next(results)
+                task_texts = dict(zip(indexes, texts))
+                _store_pages(cache, keys, task_texts)
+                extracted.update(task_texts)
+            yield i + 1, extracted.pop(i)
+
+def page_windows(pages, pages_per_window):
+    """Group page numbers into (first_page, last_page) runs of at most pages_per_window consecutive pages."""
+    windows = []
+    for page in sorted(set(pages)):
+        if windows and page == windows[-1][1] + 1 and page - windows[-1][0] < pages_per_window:
+            windows[-1][1] = page
+        else:
+            windows.append([page, page])
+    return [tuple(window) for window in windows]
+
+def _render_window(pdf_path, first_page, last_page, output_dir, dpi, fmt):
+    """Render pages [first_page, last_page] straight to files named page_<n> in output_dir.
+
+    poppler writes the images itself and they're never loaded, so the
+    window costs one poppler process rather than its pages' bitmaps.
+    """
+    prefix = uuid.uuid4().hex
+    rendered = pdf2image.convert_from_path(
+        pdf_path,
+        dpi=dpi,
+        first_page=first_page,
+        last_page=last_page,
+        fmt=fmt,
+        output_folder=output_dir,
+        output_file=prefix,
+        paths_only=True,
+        poppler_path=POPPLER_PATH
+    )
+    image_paths = []
+    for page_number, rendered_path in zip(range(first_page, last_page + 1), rendered):
+        image_path = os.path.join(output_dir, f"page_{page_number}{os.path.splitext(rendered_path)[1]}")
+        os.replace(rendered_path, image_path)
+        image_paths.append(image_path)
+    return image_paths
 
 class PDFProcessor:
-    def __init__(self, session_dir):
-        """Initialize the PDF processor with a session directory."""
+    def __init__(self, session_dir, workers=PDF_EXTRACT_WORKERS, cache=None, metrics=None):
+        """Initialize the PDF processor with a session directory.
+
+        Args:
+            session_dir: Directory the PDF is read from and results written to
+            workers: Number of processes used to extract page text
+            cache: Optional DiskLRUCache extracted text is kept in, per PDF
+                and per page, so text is only extracted once
+            metrics: Optional PipelineMetrics the page cache hits and misses
+                are counted in
+        """
         PopplerUtils.check_poppler_installation()
         self.session_dir = session_dir
+        self.workers = workers
+        self.cache = cache
+        self.metrics = metrics
 
     def process_first_pdf(self):
         """Process the first PDF found in the directory."""
@@ -38,25 +246,53 @@ class PDFProcessor:
             print(f"Error processing PDF: {str(e)}")
             return False
 
+    def iter_first_pdf_pages(self, dump_text=False):
+        """Yield (page_label, text) for the first PDF found in the directory.
+
+        Page text is handed over in memory so it can be parsed while later
+        pages are still being extracted. The PDF is removed once every page
+        has been yielded.
+
+        Args:
+            dump_text: Also save each page as a numbered TXT file for debugging
+        """
+        pdf_files = [f for f in os.listdir(self.session_dir) if f.lower().endswith('.pdf')]
+        if not pdf_files:
+            print("No PDF files found in the session directory")
+            return
+
+        pdf_path = os.path.join(self.session_dir, pdf_files[0])
+        print(f"Processing {pdf_path}...")
+
+        # A PDF seen before is skipped as a whole, without hashing its pages
+        cache = self.cache
+        pages_key = cache_key("bol-pages", file_version(pdf_path, length=None)) if cache is not None else None
+        cached = cache.get(pages_key) if pages_key is not None else None
+        if cached is not None:
+            print(f"Using cached page text for {pdf_files[0]}")
+            pages = enumerate(json.loads(cached[0]), start=1)
+        else:
+            pages = iter_page_texts(pdf_path, self.workers, cache=cache, metrics=self.metrics)
+
+        texts = []
+        for page_number, text in pages:
+            if dump_text:
+                self._save_page_text(page_number, text)
+            texts.append(text)
+            yield f"page {page_number}", text
+
+        if pages_key is not None and cached is None:
+            cache.put(pages_key, json.dumps(texts).encode("utf-8"), {"pages": len(texts)})
+
+        # Clean up the PDF file after processing
+        os.remove(pdf_path)
+        print(f"Removed processed PDF: {pdf_files[0]}")
+
     def extract_text(self, pdf_path):
         """Extract text from PDF and save as numbered TXT files."""
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for i, page in enumerate(pdf.pages):
-                    # Process one page at a time
-                    text = page.extract_text()
-                    text_path = os.path.join(self.session_dir, f"{i+1}.txt")
-                    
-                    with open(text_path, 'w', encoding='utf-8') as text_file:
-                        text_file.write(text)
-                    print(f"Saved text to {text_path}")
-                    
-                    # Clear page from memory
-                    page.flush_cache()
-                    
-                    # Force garbage collection every few pages
-                    if i % 5 == 0:
-                        gc.collect()
+            for page_number, text in iter_page_texts(pdf_path, self.workers, cache=self.cache, metrics=self.metrics):
+                self._save_page_text(page_number, text)
                         
             return True
                     
@@ -64,22 +300,59 @@ class PDFProcessor:
             print(f"Error extracting text from PDF: {str(e)}")
             return False
 
-    def extract_images(self, pdf_path):
-        """Convert PDF pages to images and save as numbered JPGs."""
+    def _save_page_text(self, page_number, text):
+        """Save one page of text as a numbered TXT file."""
+        text_path = os.path.join(self.session_dir, f"{page_number}.txt")
+        with open(text_path, 'w', encoding='utf-8') as text_file:
+            text_file.write(text)
+        print(f"Saved text to {text_path}")
+
+    def extract_images(self, pdf_path, pages=None, dpi=PDF_IMAGE_DPI, fmt=PDF_IMAGE_FORMAT,
+                       pages_per_window=PDF_PAGES_PER_WINDOW, workers=None):
+        """Render PDF pages to numbered images (page_<n>.jpg) in the session directory.
+
+        Pages are rendered in windows of consecutive pages, one poppler call
+        per window using first_page/last_page, and written straight to
+        files, so memory is bounded by the windows in flight instead of
+        growing with the page count.
+
+        Args:
+            pdf_path: PDF to render
+            pages: 1-based page numbers to render, e.g. the pages
+                DataProcessor found no table on; all pages if None
+            dpi: Resolution to render at
+            fmt: Image format, e.g. "jpeg" or "png"
+            pages_per_window: Most pages rendered by one poppler call
+            workers: Windows rendered at the same time; defaults to the
+                processor's worker count
+
+        Returns:
+            The written image paths in page order, empty on error.
+        """
         try:
-            images = pdf2image.convert_from_path(
-                pdf_path,
-                poppler_path=POPPLER_PATH
-            )
-            
-            for i, image in enumerate(images):
-                image_path = os.path.join(self.session_dir, f"page_{i+1}.jpg")
-                image.save(image_path, "JPEG")
-                print(f"Saved image to {image_path}")
+            page_count = pdf2image.pdfinfo_from_path(pdf_path, poppler_path=POPPLER_PATH)["Pages"]
+            if pages is None:
+                pages = range(1, page_count + 1)
+            windows = page_windows([page for page in pages if 1 <= page <= page_count], pages_per_window)
+            if not windows:
+                return []
+
+            with ThreadPoolExecutor(max_workers=min(workers or self.workers, len(windows))) as executor:
+                rendered = executor.map(
+                    lambda window: _render_window(pdf_path, window[0], window[1], self.session_dir, dpi, fmt),
+                    windows
+                )
+                image_paths = []
+                for window_paths in rendered:
+                    for image_path in window_paths:
+                        print(f"Saved image to {image_path}")
+                    image_paths.extend(window_paths)
+            return image_paths
                 
         except Exception as e:
             print(f"Error converting PDF to images: {str(e)}")
+            return []
 
 if __name__ == "__main__":
-    processor = PDFProcessor(".")  # Use current directory for CLI usage
+    processor = PDFProcessor(".", cache=result_cache)  # Use current directory for CLI usage
     processor.process_first_pdf() 
\ No newline at end of file
@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+from session_store import connect
+from config import RESULT_CACHE_MAX_BYTES
+
+RESULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "result_cache")
+
+def cache_key(*parts):
+    """Combine the parts an output depends on (digests, versions) into one key."""
+    return hashlib.sha256("\0".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+class DiskLRUCache:
+    """Content-addressed files on local disk, evicted least recently used first.
+
+    Entries are files named by key in cache_dir, indexed in a SQLite file
+    there with their size and last use, so every server process shares the
+    cache and its byte budget. Once the entries add up to more than
+    max_bytes the least recently used are removed. Callers build keys from
+    everything the cached output depends on, so an entry never goes stale;
+    it just stops being hit and ages out.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.db_path = os.path.join(self.cache_dir, "index.db")
+        with connect(self.db_path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " meta TEXT NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _touch(self, key):
+        """Mark an entry as used and return its metadata, or None if it isn't cached."""
+        with connect(self.db_path) as conn:
+            row = conn.execute("SELECT meta FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def _forget(self, key):
+        with connect(self.db_path) as conn:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def get(self, key):
+        """Return a cached entry as (data, meta), or None if it isn't cached."""
+        meta = self._touch(key)
+        if meta is None:
+            return None
+        try:
+            with open(self._entry_path(key), 'rb') as entry_file:
+                return entry_file.read(), meta
+        except FileNotFoundError:
+            # Evicted by another process since the lookup
+            self._forget(key)
+            return None
+
+    def get_file(self, key, dest_path):
+        """Copy a cached entry to dest_path and return its metadata, or None if it isn't cached.
+
+        dest_path is replaced atomically, so it's never left partially written.
+        """
+        meta = self._touch(key)
+        if meta is None:
+            return None
+        temp_path = f"{dest_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            shutil.copyfile(self._entry_path(key), temp_path)
+        except FileNotFoundError:
+            self._forget(key)
+            return None
+        os.replace(temp_path, dest_path)
+        return meta
+
+    def put(self, key, data, meta=None):
+        """Cache bytes under key with optional JSON-serializable metadata."""
+        self.put_many([(key, data, meta)])
+
+    def put_many(self, entries):
+        """Cache (key, data, meta) entries in a single index transaction."""
+        rows = []
+        for key, data, meta in entries:
+            if len(data) > self.max_bytes:
+                continue
+            temp_path = f"{self._entry_path(key)}.{uuid.uuid4().hex}.tmp"
+            with open(temp_path, 'wb') as entry_file:
+                entry_file.write(data)
+            os.replace(temp_path, self._entry_path(key))
+            rows.append((key, len(data), json.dumps(meta or {}), time.time()))
+        self._index(rows)
+
+    def put_file(self, key, src_path, meta=None):
+        """Cache a copy of a file under key with optional JSON-serializable metadata."""
+        if os.path.getsize(src_path) > self.max_bytes:
+            return
+        temp_path = f"{self._entry_path(key)}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(src_path, temp_path)
+        size = os.path.getsize(temp_path)
+        os.replace(temp_path, self._entry_path(key))
+        self._index([(key, size, json.dumps(meta or {}), time.time())])
+
+    def _index(self, rows):
+        if not rows:
+            return
+        with connect(self.db_path) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, size, meta, last_used) VALUES (?, ?, ?, ?)", rows
+            )
+        self._evict()
+
+    def _evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        with connect(self.db_path) as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            evicted = []
+            for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_used"):
+                if total <= self.max_bytes:
+                    break
+                evicted.append(key)
+                total -= size
+            conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in evicted])
+
+        for key in evicted:
+            try:
+                os.remove(self._entry_path(key))
+            except FileNotFoundError:
+                pass
+        print(f"Evicted {len(evicted)} cached results")
+
+# Shared cache of finished results, e.g. for re-uploads of the same file
+result_cache = DiskLRUCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES)
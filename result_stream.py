@@ -0,0 +1,56 @@
+import os
+import csv
+import zlib
+import uuid
+from openpyxl import Workbook
+
+# Bytes read from the result file per streamed chunk
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Content-Encodings the download endpoint can produce, in order of preference
+SUPPORTED_ENCODINGS = ["gzip", "deflate"]
+
+def iter_file(file_path, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield a file's contents in fixed-size chunks."""
+    with open(file_path, 'rb') as result_file:
+        while True:
+            chunk = result_file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def iter_compressed(chunks, encoding):
+    """Compress a stream of byte chunks for the given Content-Encoding.
+
+    Args:
+        chunks: Iterable of bytes
+        encoding: "gzip" or "deflate" (zlib-wrapped, as HTTP defines it)
+    """
+    wbits = 16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS
+    compressor = zlib.compressobj(6, zlib.DEFLATED, wbits)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def xlsx_path_for(csv_path):
+    """Return the path of the XLSX copy of a result CSV, converting it if needed.
+
+    The workbook is written next to the CSV and reused until the CSV changes.
+    """
+    xlsx_path = os.path.splitext(csv_path)[0] + ".xlsx"
+    if os.path.exists(xlsx_path) and os.path.getmtime(xlsx_path) >= os.path.getmtime(csv_path):
+        return xlsx_path
+
+    # Write-only mode streams rows to disk instead of building the sheet in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    with open(csv_path, 'r', newline='', encoding='utf-8') as csv_file:
+        for row in csv.reader(csv_file):
+            sheet.append(row)
+
+    temp_path = f"{xlsx_path}.{uuid.uuid4().hex}.tmp"
+    workbook.save(temp_path)
+    os.replace(temp_path, xlsx_path)
+    return xlsx_path
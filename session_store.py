@@ -0,0 +1,154 @@
+import os
+import time
+import shutil
+import sqlite3
+import secrets
+import threading
+from contextlib import contextmanager
+
+@contextmanager
+def connect(db_path):
+    """Open a SQLite connection that commits on success and is always closed.
+
+    A connection per call keeps the shared SQLite files safe to use from
+    any thread and any server process.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+class SessionIndex:
+    """SQLite index of processing session directories and their creation times.
+
+    The index is shared by all server processes, so expiring sessions is a
+    single indexed query instead of a scan of the sessions directory.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with connect(self.db_path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " session_id TEXT PRIMARY KEY,"
+                " path TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_created_at ON sessions (created_at)")
+
+    def register(self, session_id, path, created_at=None):
+        """Record a session directory; existing entries keep their creation time."""
+        with connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, path, created_at) VALUES (?, ?, ?)",
+                (session_id, path, created_at or time.time())
+            )
+
+    def expired(self, cutoff):
+        """Return (session_id, path) for sessions created before cutoff."""
+        with connect(self.db_path) as conn:
+            return conn.execute(
+                "SELECT session_id, path FROM sessions WHERE created_at < ?", (cutoff,)
+            ).fetchall()
+
+    def remove(self, session_id):
+        with connect(self.db_path) as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def import_directories(self, sessions_root):
+        """Index session directories created before the index existed."""
+        if not os.path.exists(sessions_root):
+            return
+        entries = []
+        for item in os.listdir(sessions_root):
+            item_path = os.path.join(sessions_root, item)
+            if os.path.isdir(item_path):
+                entries.append((item, item_path, os.path.getctime(item_path)))
+        with connect(self.db_path) as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO sessions (session_id, path, created_at) VALUES (?, ?, ?)",
+                entries
+            )
+
+class ResultRegistry:
+    """SQLite registry mapping download tokens to finished output files."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with connect(self.db_path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " token TEXT PRIMARY KEY,"
+                " path TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_created_at ON results (created_at)")
+
+    def register(self, path):
+        """Record a finished output file and return its download token."""
+        token = secrets.token_urlsafe(16)
+        with connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO results (token, path, created_at) VALUES (?, ?, ?)",
+                (token, path, time.time())
+            )
+        return token
+
+    def lookup(self, token):
+        """Return the output path for a download token, or None."""
+        with connect(self.db_path) as conn:
+            row = conn.execute("SELECT path FROM results WHERE token = ?", (token,)).fetchone()
+        return row[0] if row else None
+
+    def expire(self, cutoff):
+        """Forget results registered before cutoff."""
+        with connect(self.db_path) as conn:
+            conn.execute("DELETE FROM results WHERE created_at < ?", (cutoff,))
+
+class SessionJanitor:
+    """Background thread that removes expired sessions and job records."""
+
+    def __init__(self, session_index, ttl_seconds, interval_seconds, job_manager=None, result_registry=None):
+        """Initialize the janitor.
+
+        Args:
+            session_index: SessionIndex the expired sessions are looked up in
+            ttl_seconds: Age after which a session and its files are removed
+            interval_seconds: Time between cleanup runs
+            job_manager: Optional JobManager whose old job records are removed too
+            result_registry: Optional ResultRegistry whose old tokens are removed too
+        """
+        self.session_index = session_index
+        self.ttl_seconds = ttl_seconds
+        self.interval_seconds = interval_seconds
+        self.job_manager = job_manager
+        self.result_registry = result_registry
+        self._thread = None
+
+    def start(self):
+        """Start the cleanup thread if it isn't already running."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="session-janitor", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.cleanup()
+            except Exception as e:
+                print(f"Error cleaning up sessions: {e}")
+            time.sleep(self.interval_seconds)
+
+    def cleanup(self):
+        """Remove sessions older than the TTL."""
+        for session_id, path in self.session_index.expired(time.time() - self.ttl_seconds):
+            shutil.rmtree(path, ignore_errors=True)
+            self.session_index.remove(session_id)
+            print(f"Cleaned up old session: {session_id}")
+
+        if self.job_manager:
+            self.job_manager.cleanup(max_age_seconds=self.ttl_seconds)
+        if self.result_registry:
+            self.result_registry.expire(time.time() - self.ttl_seconds)
@@ -0,0 +1,97 @@
+import os
+import re
+import json
+import numpy as np
+import pandas as pd
+
+# Retailer rules for the "Ship to Name" column of the 940 merge
+SHIP_TO_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "master_data", "ship_to_rules.json")
+
+def compile_rules(rules):
+    """Compile ship-to rules into one regex that reports the first matching rule.
+
+    Each rule becomes a lookahead branch of a single alternation, tried in
+    rule order, so the match's lastindex is the first rule (not the first
+    position in the address) that applies, like an if/elif chain.
+
+    Args:
+        rules: List of {"name", "contains", "words"} dicts. "contains"
+            aliases match anywhere in the address, "words" aliases only
+            between spaces or the ends of the address.
+    """
+    branches = []
+    for rule in rules:
+        aliases = [re.escape(alias.upper()) for alias in rule.get("contains", [])]
+        aliases += [rf"(?:^|(?<= )){re.escape(alias.upper())}(?= |\Z)" for alias in rule.get("words", [])]
+        if not aliases:
+            raise ValueError(f"Ship-to rule {rule.get('name')!r} has no aliases")
+        branches.append(rf"(?=.*?(?:{'|'.join(aliases)}))()")
+    if not branches:
+        return None
+    return re.compile("|".join(branches), re.DOTALL)
+
+class ShipToClassifier:
+    """Maps Ship To Address 1 values to a ship-to name using a JSON rule table.
+
+    The first rule with an alias in the upper-cased address names it;
+    otherwise the address's first word is used. Each distinct address is
+    classified once per column. The rule file is reloaded when it changes,
+    so adding a retailer doesn't need a restart.
+    """
+
+    def __init__(self, rules_path):
+        """Load and compile the rule table.
+
+        Raises:
+            ValueError: If the rule file is missing or invalid.
+        """
+        self.rules_path = rules_path
+        self._rules = (None, [])  # (compiled pattern, rule names), swapped as one
+        self._stamp = None
+        self._refresh(raise_errors=True)
+
+    def _refresh(self, raise_errors=False):
+        """Recompile the rules if the file has changed; keep the old ones if it's invalid."""
+        try:
+            stat = os.stat(self.rules_path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            if stamp == self._stamp:
+                return
+            with open(self.rules_path, 'r', encoding='utf-8') as rules_file:
+                rules = json.load(rules_file)["rules"]
+            pattern = compile_rules(rules)
+        except (OSError, ValueError, KeyError, TypeError, re.error) as e:
+            if raise_errors:
+                raise ValueError(f"Invalid ship-to rules {self.rules_path}: {e}") from e
+            print(f"Error reloading ship-to rules, keeping the previous rules: {e}")
+            return
+
+        self._rules = (pattern, [rule["name"] for rule in rules])
+        self._stamp = stamp
+        print(f"Loaded {len(rules)} ship-to rules from {self.rules_path}")
+
+    def name_for(self, address):
+        """Return the ship-to name for one address ("" for missing values)."""
+        if not isinstance(address, str):
+            return ""
+
+        address = address.strip().upper()
+        pattern, names = self._rules
+        if pattern is not None:
+            match = pattern.match(address)
+            if match:
+                return names[match.lastindex - 1]
+
+        # Extract first word (split by whitespace and take first element)
+        words = address.split()
+        return words[0] if words else ""
+
+    def classify(self, addresses):
+        """Return the ship-to names for a column of addresses as an object array."""
+        self._refresh()
+        codes, uniques = pd.factorize(pd.Series(addresses, dtype=object), use_na_sentinel=False)
+        names = np.array([self.name_for(address) for address in uniques], dtype=object)
+        return names[codes]
+
+# Shared classifier used by the 940 merge
+ship_to_classifier = ShipToClassifier(SHIP_TO_RULES_FILE)
@@ -0,0 +1,132 @@
+import os
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+from config import CSV_CHUNK_SIZE
+
+# Strings pandas reads as missing by default (read_csv/read_excel na_values)
+NA_VALUES = frozenset([
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+])
+
+def _cell_text(value, memo):
+    """Render a cell value the way pd.read_excel(dtype=str) does, or NaN if it's missing.
+
+    pandas keeps the first of equal values (1, 1.0, True) per column, so
+    each column passes its own memo.
+    """
+    if value is None:
+        return float("nan")
+    if isinstance(value, str):
+        # Error cells (#DIV/0!, ...) come back as their code; pandas reads them as NaN
+        return float("nan") if value in NA_VALUES or value in ERROR_CODES else value
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(memo.setdefault(value, value))
+
+def _iter_xlsx_chunks(file_path, chunk_size, columns=None):
+    """Stream the first sheet of a workbook as DataFrames of at most chunk_size rows.
+
+    Uses openpyxl's read-only mode, so rows are parsed as they're read, and
+    only the requested columns are converted. Values match
+    pd.read_excel(dtype=str): blank rows inside the sheet are kept as empty
+    lines and trailing blank rows are dropped. Columns are named from the
+    header row, so cells to the right of the last header cell are ignored.
+    """
+    names = read_table_header(file_path).columns.tolist()
+    if columns is None:
+        positions = list(range(len(names)))
+    else:
+        positions = sorted(names.index(column) for column in columns)
+    selected_names = [names[position] for position in positions]
+    memos = [{} for _ in positions]
+
+    def to_frame(rows):
+        return pd.DataFrame(rows, columns=selected_names, dtype=str)
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[0]
+        # Saved dimensions can be wrong; read the rows that are actually there
+        sheet.reset_dimensions()
+
+        chunk = []
+        blank_rows = 0  # Held back until a later row shows they aren't trailing
+        chunks_yielded = 0
+        for row in sheet.iter_rows(min_row=2, max_col=max(len(names), 1), values_only=True):
+            if all(value is None or value == "" for value in row):
+                blank_rows += 1
+                continue
+            chunk.extend([[float("nan")] * len(positions)] * blank_rows)
+            blank_rows = 0
+            chunk.append([
+                _cell_text(row[position] if position < len(row) else None, memo)
+                for position, memo in zip(positions, memos)
+            ])
+            while len(chunk) >= chunk_size:
+                yield to_frame(chunk[:chunk_size])
+                del chunk[:chunk_size]
+                chunks_yielded += 1
+
+        if chunk or not chunks_yielded:
+            # Always yield one chunk so callers can see the columns
+            yield to_frame(chunk)
+    finally:
+        workbook.close()
+
+def read_table_header(file_path):
+    """Return an empty DataFrame with the columns of a CSV or Excel file."""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".csv":
+        return pd.read_csv(file_path, dtype=str, nrows=0)
+    elif ext in [".xlsx", ".xls"]:
+        # Only the header row is read
+        return pd.read_excel(file_path, dtype=str, nrows=0)
+    raise ValueError("Unsupported file extension")
+
+def _column_positions(file_path, columns):
+    """Map column names to positions, which pandas' usecols can't confuse with mangled duplicates."""
+    if columns is None:
+        return None
+    header = read_table_header(file_path).columns.tolist()
+    return sorted(header.index(column) for column in columns)
+
+def read_table(file_path, columns=None):
+    """Read a CSV or Excel file with all columns as strings.
+
+    If given, only the named columns (as returned by read_table_header)
+    are read, and .xlsx sheets are streamed instead of loaded whole.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".csv":
+        return pd.read_csv(file_path, dtype=str, usecols=_column_positions(file_path, columns))
+    elif ext == ".xlsx" and columns is not None:
+        return pd.concat(list(_iter_xlsx_chunks(file_path, CSV_CHUNK_SIZE, columns)), ignore_index=True)
+    elif ext in [".xlsx", ".xls"]:
+        return pd.read_excel(file_path, dtype=str, usecols=_column_positions(file_path, columns))
+    raise ValueError("Unsupported file extension")
+
+def iter_table_chunks(file_path, chunk_size=CSV_CHUNK_SIZE, columns=None):
+    """Yield a CSV or Excel file as DataFrames of at most chunk_size rows.
+
+    CSV and .xlsx files are read incrementally; legacy .xls files have no
+    streaming reader, so the sheet is read once and sliced. If given, only
+    the named columns are read. At least one (possibly empty) chunk is
+    always yielded so callers can see the columns.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".csv":
+        with pd.read_csv(file_path, dtype=str, chunksize=chunk_size,
+                         usecols=_column_positions(file_path, columns)) as reader:
+            yield from reader
+    elif ext == ".xlsx":
+        yield from _iter_xlsx_chunks(file_path, chunk_size, columns)
+    elif ext == ".xls":
+        df = read_table(file_path, columns)
+        if df.empty:
+            yield df
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size].reset_index(drop=True)
+    else:
+        raise ValueError("Unsupported file extension")
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# The app modules live at the repository root; app.py needs an API key to import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPEN_AI_API_KEY", "test")
+
+from master_data import MasterUOM  # noqa: E402
+
+COLUMNS_940 = ["Num", "Ship Date", "P. O. #", "CANCEL DATE", "Item", "Qty", "Ship To Address 1"]
+
+@pytest.fixture
+def write_940():
+    """Return a function that writes a 940 CSV of the given items and quantities."""
+    def write(path, items, qtys):
+        rows = [
+            [f"I{i}", "1/2/2024", f"PO {i}", "", item, qty, "CROSS TOWN"]
+            for i, (item, qty) in enumerate(zip(items, qtys))
+        ]
+        pd.DataFrame(rows, columns=COLUMNS_940).to_csv(path, index=False)
+        return str(path)
+    return write
+
+@pytest.fixture
+def master(tmp_path):
+    """A three-item master UOM table loaded from a CSV file."""
+    uom = pd.DataFrame({
+        "Item #": ["AB-100", "CD-200", "EF-300"],
+        "Sequence 10: QTY": ["12", "24", "6"],
+        "Weight": ["10.5", "8", "3.25"],
+        "Cube": ["1,728.00", "2,000.00", "500.00"],
+        "Length": ["12", "20", "10"],
+        "Width": ["12", "10", "10"],
+        "Height": ["12", "10", "5"],
+    })
+    uom_path = tmp_path / "uom.csv"
+    uom.to_csv(uom_path, index=False)
+    return MasterUOM.load(str(uom_path))
@@ -0,0 +1,44 @@
+import io
+import os
+import time
+
+import app
+
+def wait_for(client, job_id, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/jobs/{job_id}").get_json()
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.05)
+    raise TimeoutError(f"Job {job_id} did not finish")
+
+def test_concurrent_uploads_in_one_session_download_their_own_output(tmp_path, write_940):
+    files = {
+        "a.csv": write_940(tmp_path / "a.csv", ["0125-860-FWZBX", "NOT-A-STYLE"] * 300, ["72", "5"] * 300),
+        "b.csv": write_940(tmp_path / "b.csv", ["02 673491/12000 UNIT"] * 500, ["24"] * 500),
+    }
+
+    expected = {}
+    for name, file_path in files.items():
+        reference_dir = str(tmp_path / f"reference_{name}")
+        os.mkdir(reference_dir)
+        assert app.process_second_csv(file_path, reference_dir, cache=None)[0]
+        with open(os.path.join(reference_dir, app.OUTPUT_CSV_NAME), 'rb') as output_file:
+            expected[name] = output_file.read()
+
+    # Queue both files over and over in one session, so their jobs overlap
+    client = app.app.test_client()
+    submitted = []
+    for _ in range(10):
+        for name, file_path in files.items():
+            with open(file_path, 'rb') as upload:
+                response = client.post("/upload-second-csv", data={"file": (io.BytesIO(upload.read()), name)})
+            assert response.status_code == 202
+            submitted.append((name, response.get_json()['job_id']))
+
+    for name, job_id in submitted:
+        job = wait_for(client, job_id)
+        assert job['status'] == 'done', job.get('error')
+        assert client.get(job['download_url']).data == expected[name]
+        assert client.get(f"/download?job_id={job_id}").data == expected[name]
@@ -0,0 +1,38 @@
+import os
+
+from app import process_second_csv
+from result_cache import DiskLRUCache
+
+def read_output(session_dir):
+    with open(os.path.join(session_dir, "940IHL_processed.csv"), 'rb') as output_file:
+        return output_file.read()
+
+def test_upload_caches_its_own_output_when_another_upload_in_the_session_finishes_first(tmp_path, master, write_940):
+    session_dir = str(tmp_path / "session")
+    os.mkdir(session_dir)
+    file_a = write_940(tmp_path / "a.csv", ["AB-100", "CD-200"] * 20, ["24", "48"] * 20)
+    file_b = write_940(tmp_path / "b.csv", ["EF-300", "XX-999"] * 30, ["6", "1"] * 30)
+
+    expected = {}
+    for file_path in (file_a, file_b):
+        reference_dir = str(tmp_path / f"reference_{os.path.basename(file_path)}")
+        os.mkdir(reference_dir)
+        assert process_second_csv(file_path, reference_dir, master=master, cache=None)[0]
+        expected[file_path] = read_output(reference_dir)
+    assert expected[file_a] != expected[file_b]
+
+    class InterleavedCache(DiskLRUCache):
+        """Finishes an upload of file b in the same session while file a is being cached."""
+
+        def put_file(self, key, src_path, meta=None):
+            assert process_second_csv(file_b, session_dir, master=master, cache=None)[0]
+            super().put_file(key, src_path, meta)
+
+    cache = InterleavedCache(str(tmp_path / "cache"), 64 * 1024 * 1024)
+    assert process_second_csv(file_a, session_dir, master=master, cache=cache)[0]
+
+    # Uploading file a again is served from the cache, with file a's output
+    hit_dir = str(tmp_path / "hit")
+    os.mkdir(hit_dir)
+    assert process_second_csv(file_a, hit_dir, master=master, cache=cache)[0]
+    assert read_output(hit_dir) == expected[file_a]
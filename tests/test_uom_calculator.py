@@ -0,0 +1,13 @@
+import pandas as pd
+
+from uom_calculator import calculate_uom_columns
+
+def test_negative_qty_under_one_carton_rounds_to_zero_cartons(master):
+    # -6 pieces of a 12-piece carton is -0.5 cartons, which rounds up to 0
+    columns, match_types = calculate_uom_columns(pd.Series(["AB100", "AB100"]), pd.Series(["-6", "-18"]), master)
+
+    assert list(match_types) == ["exact", "exact"]
+    assert list(columns[21]) == ["-0.50", "-1.50"]
+    assert list(columns[22]) == ["0", "-1"]
+    assert list(columns[31]) == ["0.00", "-1.30"]
+    assert list(columns[34]) == ["40.00", "27.50"]
@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+from metrics import timed_stage
+
+# Output columns filled from the master UOM data and the derived formulas
+UOM_OUTPUT_COLUMNS = {
+    20: "qty",        # UOM (from Sequence 10: QTY)
+    23: "weight",     # weight w/out add
+    25: "cube",       # cube in cm
+    26: "length",     # Length
+    27: "width",      # Width
+    28: "height",     # Height
+}
+
+# Helper function to safely convert string to float
+def safe_float(value, default=0.0):
+    try:
+        # Clean the value by removing commas and other non-numeric characters
+        if isinstance(value, str):
+            # Remove commas and other thousands separators
+            value = value.replace(',', '')
+            # Replace other potential decimal separators
+            value = value.replace(' ', '')
+        return float(value) if pd.notna(value) and value != "" else default
+    except (ValueError, TypeError):
+        print(f"Failed to convert '{value}' to float, using default {default}")
+        return default
+
+def parse_float_column(values, default=0.0):
+    """Convert a column of raw values to a float array with safe_float rules.
+
+    Each distinct value is parsed once, so repeated quantities and master
+    values cost a single conversion.
+    """
+    series = pd.Series(values, dtype=object)
+    parsed = {}
+    for value in pd.unique(series):
+        key = "" if pd.isna(value) else value
+        if key not in parsed:
+            parsed[key] = safe_float(value, default)
+    keys = series.where(series.notna(), "")
+    return keys.map(parsed).to_numpy(dtype=np.float64)
+
+def build_item_table(item_data):
+    """Build the master item table used for the merge, with parsed floats."""
+    items = pd.DataFrame.from_dict(
+        item_data, orient='index',
+        columns=["weight", "cube", "length", "width", "height", "qty"]
+    )
+    for column in ["weight", "cube", "length", "width", "height", "qty"]:
+        items[f"{column}_value"] = parse_float_column(items[column])
+    return items
+
+def _check_ceil(cartons, pallet_cubes):
+    """Raise math.ceil's error for the first line whose values can't be rounded up.
+
+    Lines are checked in file order, cartons before pallets, so errors match
+    the row-by-row calculation.
+    """
+    bad_cartons = ~np.isfinite(cartons)
+    bad_pallets = ~np.isfinite(pallet_cubes)
+    bad = bad_cartons | bad_pallets
+    if not bad.any():
+        return
+    first_bad = np.argmax(bad)
+    value = cartons[first_bad] if bad_cartons[first_bad] else pallet_cubes[first_bad]
+    if np.isnan(value):
+        raise ValueError("cannot convert float NaN to integer")
+    raise OverflowError("cannot convert float infinity to integer")
+
+def _format(template, values):
+    return np.char.mod(template, values).astype(object)
+
+def calculate_uom_columns(items_normalized, total_pieces, master, metrics=None):
+    """Join 940 lines to the master UOM data and compute the derived columns.
+
+    Args:
+        items_normalized: Normalized item numbers of the 940 lines
+        total_pieces: Raw Qty values of the 940 lines
+        master: MasterUOM holding the item table and matcher
+        metrics: Optional PipelineMetrics; the join is timed as the
+            "item_match" stage and the formulas as "calc"
+
+    Returns:
+        Tuple of (columns, match_types). columns maps output column index to
+        an object array of cell values ("" for unmatched lines); match_types
+        holds "exact", "partial" or "none" per line.
+    """
+    with timed_stage(metrics, "item_match") as stage:
+        lines = pd.DataFrame({"normalized_item": pd.Series(items_normalized, dtype=object).to_numpy()})
+
+        # Resolve each distinct item once, then join the master data with a merge
+        resolved = {
+            item: master.matcher.match(item)
+            for item in pd.unique(lines["normalized_item"])
+        }
+        lines["matched_key"] = lines["normalized_item"].map({item: match[0] for item, match in resolved.items()})
+        lines["match_type"] = lines["normalized_item"].map({item: match[1] for item, match in resolved.items()})
+        merged = lines.merge(master.items, how='left', left_on='matched_key', right_index=True)
+        stage.add(rows=len(lines))
+
+    with timed_stage(metrics, "calc") as stage:
+        stage.add(rows=len(merged))
+        return _derive_uom_columns(merged, total_pieces)
+
+def _derive_uom_columns(merged, total_pieces):
+    """Fill the output columns of calculate_uom_columns from the joined lines."""
+    num_rows = len(merged)
+    matched = (merged["match_type"] != "none").to_numpy()
+    columns = {col: np.full(num_rows, "", dtype=object) for col in range(20, 35)}
+    if not matched.any():
+        return columns, merged["match_type"].to_numpy()
+
+    rows = merged[matched]
+    for col, field in UOM_OUTPUT_COLUMNS.items():
+        values = rows[field]
+        columns[col][matched] = values.where(values.notna(), "").to_numpy(dtype=object)
+
+    pieces = parse_float_column(pd.Series(total_pieces, dtype=object).to_numpy()[matched])
+    uom = rows["qty_value"].to_numpy()
+    weight_wo_add = rows["weight_value"].to_numpy()
+    length = rows["length_value"].to_numpy()
+    width = rows["width_value"].to_numpy()
+    height = rows["height_value"].to_numpy()
+    cube_in_cm = rows["cube_value"].to_numpy()
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # Cartons = total pieces / UOM, CARTONS = rounded up Cartons
+        cartons = np.where(uom > 0, pieces / np.where(uom > 0, uom, 1.0), 0.0)
+        # + 0.0 turns the -0.0 of cartons in (-1, 0) into 0, like the int math.ceil returned
+        cartons_rounded = np.ceil(cartons) + 0.0
+
+        # individual carton weight = weight w/out add + 2
+        individual_weight = weight_wo_add + 2
+
+        # dimension = (L * W * H) / 1728
+        dimension = np.where((length > 0) & (width > 0) & (height > 0),
+                             (length * width * height) / 1728, 0.0)
+
+        # cube in cft = cube in cm / 1728 + 0.3
+        cube_in_cft = (cube_in_cm / 1728) + 0.3
+
+        # total cubes = cube in cft * CARTONS (using rounded up value)
+        total_cubes = cube_in_cft * cartons_rounded
+
+        # PALLET = ceil(total_cubes / 65); 0-64 = 1 pallet, 65-129 = 2 pallets, etc.
+        pallet_cubes = np.where(total_cubes > 0, total_cubes / 65, 1.0)
+        _check_ceil(cartons, pallet_cubes)
+        pallets = np.ceil(pallet_cubes)
+
+        # FINAL CUBE = PALLET * 130
+        final_cube = pallets * 130
+
+        # TOTAL WEIGHT = (CARTONS * individual carton weight) + (PALLET * 40)
+        total_weight = (cartons_rounded * individual_weight) + (pallets * 40)
+
+    columns[21][matched] = _format('%.2f', cartons)
+    columns[22][matched] = _format('%d', cartons_rounded)
+    columns[24][matched] = _format('%.2f', individual_weight)
+    columns[29][matched] = _format('%.2f', dimension)
+    columns[30][matched] = _format('%.2f', cube_in_cft)
+    columns[31][matched] = _format('%.2f', total_cubes)
+    columns[32][matched] = _format('%d', pallets)
+    columns[33][matched] = _format('%d', final_cube)
+    columns[34][matched] = _format('%.2f', total_weight)
+
+    return columns, merged["match_type"].to_numpy()